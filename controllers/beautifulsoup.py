@@ -1,46 +1,110 @@
 import urllib.request as request
 from urllib.error import HTTPError
+from concurrent.futures import ThreadPoolExecutor
+from queue import Queue
+from threading import Thread
 from bs4 import BeautifulSoup, Tag, NavigableString
-from typing import Union, List, Dict, Tuple
+from typing import Union, List, Dict, Tuple, Iterator
 from tqdm import tqdm
+import hashlib
+import json
 import re
 import math
-import os.path as path
-import os
 import regex
 
+from controllers.html_cache import HTMLCache
 from controllers.ui import error, debug
 from soup_targets import wiktionary_root
-from settings import cache_html, offline_mode, html_cache_path
-from utils.web import prepare_filename
+from settings import cache_html, offline_mode, fetch_workers, requests_per_second, \
+    listing_prefetch, html_parser, slice_word_pages, cache_parsed_pages
+from utils.web import RateLimiter
 
 
-def simple_get(url: str) -> bytes:
-    fname = prepare_filename(url)
-    fpath = path.join(html_cache_path, fname)
+request_limiter = RateLimiter(requests_per_second)
+parse_version = 1  # Part of the key of every cached parse, bump it when a change to the scrapers alters their output
 
-    if offline_mode or (path.exists(fpath) and cache_html):
-        if path.exists(fpath):
-            with open(fpath, 'rb') as fp:
-                return fp.read()
-        else:
+
+def simple_get(url: str) -> bytes:
+    cached = None
+    if offline_mode or cache_html:
+        cached = HTMLCache.get_instance().entry(url)
+        if cached is not None and (offline_mode or HTMLCache.get_instance().fresh(cached)):
+            return cached[0]
+        elif cached is None and offline_mode:
             error('URL {} doesn\'t exist in html cache for offline mode'.format(url))
 
     req = request.Request(url)
+    if cached is not None:
+        # Only stale pages get here, the server is asked to skip sending them again if they haven't changed
+        _, _, etag, last_modified = cached
+        if etag is not None:
+            req.add_header('If-None-Match', etag)
+        if last_modified is not None:
+            req.add_header('If-Modified-Since', last_modified)
+
+    request_limiter.wait()
     try:
         with request.urlopen(req) as resp:
             html = resp.read()
             if cache_html:
-                if not path.exists(html_cache_path):
-                    os.makedirs(html_cache_path, exist_ok=True)
-
-                with open(fpath, 'wb+') as fp:
-                    fp.write(html)
+                HTMLCache.get_instance().put(url, html, etag=resp.headers.get('ETag'),
+                                             last_modified=resp.headers.get('Last-Modified'))
             return html
     except HTTPError as e:
+        if e.code == 304 and cached is not None:
+            HTMLCache.get_instance().revalidated(url)
+            return cached[0]
         error('URL {} had an error {} {}'.format(url, e.code, e.read()))
 
 
+def share_request_rate(processes: int):
+    """
+    Splits requests_per_second between processes scraping at the same time, meant to be run in each of them
+    """
+    global request_limiter
+    request_limiter = RateLimiter(requests_per_second / processes)
+
+
+def unseen_forms(tables: List[Tuple[str, Union[Dict[str, str], str]]], table_set: set) -> list:
+    """
+    :param tables: (table header, form) pairs
+    :param table_set: The headers of the tables that have been seen already, new headers are added to it
+    :return: Returns the forms of the tables whose headers weren't in table_set, in order
+    """
+    forms = []
+    for header, form in tables:
+        if header not in table_set:
+            table_set.add(header)
+            forms.append(form)
+    return forms
+
+
+def old_english_section(html: bytes) -> bytes:
+    """
+    :param html: A word page
+    :return: Returns the part of the page from the Old English heading up to the heading of the next language,
+    or an empty document if the page has no Old English section
+    """
+    anchor = html.find(b'id="Old_English"')
+    if anchor < 0:
+        return b''
+
+    start = html.rfind(b'<h2', 0, anchor)
+    end = html.find(b'<h2', anchor)
+    return html[start if start >= 0 else 0:end if end >= 0 else len(html)]
+
+
+def make_soup(html: bytes, old_english_only: bool = False) -> BeautifulSoup:
+    """
+    :param html: The page to parse
+    :param old_english_only: Whether only the Old English section of the page is needed
+    :return: Returns the page parsed with the tree builder chosen by html_parser
+    """
+    if old_english_only and slice_word_pages:
+        html = old_english_section(html)
+    return BeautifulSoup(html, html_parser)
+
+
 def table_parsing(table: BeautifulSoup, parsings: List[Tuple[str, int, int]]) -> Dict[str, str]:
     result = {}
     rows = table.find_all('tr')
@@ -63,13 +127,14 @@ class OEScraper:
         self.soup: Union[None, BeautifulSoup] = None
         self.word_list: List[str] = []
         self.table_set = set() if initial_table_set is None else initial_table_set
+        self.defer_tables = False  # Leave the table dedupe to the caller, see unseen_forms
         self.all_pages = all_pages
         self.setup()
 
     def setup(self):
         resp = simple_get(self.url)
         if resp is not None:
-            self.soup = BeautifulSoup(resp, 'html.parser')
+            self.soup = make_soup(resp)
 
     @staticmethod
     def parse_table(table: BeautifulSoup, parsings: List[Tuple[str, int, int]]) -> Dict[str, str]:
@@ -124,38 +189,78 @@ class OEScraper:
         debug('{} did not have a page count entry'.format(self.url))
         return -1
 
-    def parse_page(self, word: str, page_url: str) -> Union[List[Dict[str, str]], None]:
+    def parse_html(self, word: str, html: bytes) -> Union[List[Dict[str, str]], None]:
         pass
 
-    def find_words(self):
-        if self.soup is not None:
-            tpc = self.get_paqe_count()
+    def parse_page(self, word: str, page_url: str) -> Union[List[Dict[str, str]], None]:
+        html = simple_get(page_url)
+        if html is not None:
+            return self.parse_html(word, html)
+        return None
 
-            self.word_list = []
+    @staticmethod
+    def fetch_pages(links: List[Tuple[str, str]]) -> Iterator[Tuple[str, Union[bytes, None]]]:
+        """
+        Fetches the word pages linked from a category page fetch_workers at a time
+        :param links: The word and url of each entry of the category page
+        :return: Yields the word and the html of each page in the order of links,
+        a page is yielded as soon as it and every page before it have arrived
+        """
+        with ThreadPoolExecutor(fetch_workers) as pool:
+            yield from zip([w for w, _ in links], pool.map(simple_get, [u for _, u in links]))
+
+    def category_pages(self) -> Iterator[Tuple[int, List[Tuple[str, str]]]]:
+        """
+        Walks the listing pages of the category in a background thread, following their next page links,
+        so that the next listings are already waiting by the time the words of the current one are parsed
+        :return: Yields the page number and the word and url of each entry of every listing page,
+        an error raised while walking them is raised here after the listings before it
+        """
+        tpc = self.get_paqe_count()
+        page_count = tpc if self.all_pages else 1
+        listings = Queue(maxsize=listing_prefetch)
+
+        def walk():
             page_soup = self.soup
-            for p in range(tpc if self.all_pages else 1):
-                next_link = page_soup.find('a', text='next page')
-                if next_link is not None:
-                    next_url = wiktionary_root + '/' + next_link['href']
-                else:
-                    next_url = None
+            end = None
+            try:
+                for p in range(page_count):
+                    listings.put((p, [(li.text, wiktionary_root + '/' + li.find('a').get('href'))
+                                      for li in self.find_element_items(page_soup)]))
+
+                    next_link = page_soup.find('a', text='next page')
+                    if next_link is None or p + 1 == page_count:
+                        break
 
-                lis = self.find_element_items(page_soup)
-                for li in tqdm(lis, desc='Page {}'.format(p + 1)):
-                    link = li.find('a').get('href')
-                    page = wiktionary_root + '/' + link
-                    forms = self.parse_page(li.text, page)
+                    phtml = simple_get(wiktionary_root + '/' + next_link['href'])
+                    if phtml is None:
+                        error('Failed to load the next page, finished {} of {}'.format(p + 1, tpc))
+                        break
+                    page_soup = make_soup(phtml)
+            except Exception as e:
+                end = e  # Raised by the consumer once it has taken the listings from before it
+            finally:
+                listings.put(end)
+
+        Thread(target=walk, daemon=True).start()
+        while True:
+            listing = listings.get()
+            if isinstance(listing, Exception):
+                raise listing
+            if listing is None:
+                return
+            yield listing
+
+    def find_words(self):
+        if self.soup is not None:
+            self.word_list = []
+            for p, links in self.category_pages():
+                for word, html in tqdm(self.fetch_pages(links), total=len(links), desc='Page {}'.format(p + 1)):
+                    forms = self.parse_html(word, html) if html is not None else None
                     if forms is not None:
                         self.word_list.append(forms)
                     else:
-                        debug('{} did not have any forms'.format(li.text))
-                if next_url is not None:
-                    phtml = simple_get(next_url)
-                    if phtml is not None:
-                        page_soup = BeautifulSoup(phtml, 'html.parser')
-                    else:
-                        error('Failed to load the next page, finished {} of {}'.format(p + 1, tpc))
-                        break
+                        debug('{} did not have any forms'.format(word))
 
         return self.word_list
 
@@ -182,18 +287,61 @@ class OEWordScraper(OEScraper):
     def parse_forms(self, word: str, soup, form_dict: Dict[str, Union[str, List[str], List[Dict[str, str]]]]):
         pass
 
-    def parse_page(self, word: str, url: str) -> Union[Dict[str, Union[str, List[str], List[Dict[str, str]]]], None]:
-        resp = simple_get(url)
-        if resp is not None:
-            decls = {'word': word, 'forms': []}
-            w_soup = BeautifulSoup(resp, 'html.parser')
+    def parse_signature(self) -> tuple:
+        """
+        :return: Returns everything besides the page itself that the result of extract_tables depends on
+        """
+        return parse_version, type(self).__name__, self.pos_regex.pattern, html_parser, slice_word_pages
+
+    def extract_tables(self, word: str, html: bytes) -> Union[Dict[str, list], None]:
+        """
+        Parses a word page without regard for the tables that have already been seen
+        :return: Returns a dictionary with the definitions of the word and a list of (table header, form) pairs for
+        every form table on the page, or None if the page has no entry for the part of speech
+        """
+        page = {'definitions': [], 'tables': []}
+        w_soup = make_soup(html, True)
+
+        header = self.parse_definitions(w_soup, page)
+        if header is not None:
+            self.parse_forms(word, header, page)
+            return page
+        else:
+            debug('{} is not in old english'.format(word))
+        return None
 
-            header = self.parse_definitions(w_soup, decls)
-            if header is not None:
-                self.parse_forms(word, header, decls)
-                return decls
-            else:
-                debug('{} is not in old english'.format(word))
+    def parse_tables(self, word: str, html: bytes) -> Union[Dict[str, list], None]:
+        """
+        extract_tables, but the results are cached by the hash of the page and parse_signature
+        when cache_parsed_pages is set, so pages that haven't changed are never parsed twice
+        """
+        if not cache_parsed_pages:
+            return self.extract_tables(word, html)
+
+        key = hashlib.sha1(repr(self.parse_signature()).encode('utf8') + html).hexdigest()
+        cache = HTMLCache.get_instance()
+        result = cache.parsed(key)
+        if result is None:
+            page = self.extract_tables(word, html)
+            cache.put_parsed(key, json.dumps(page))
+            return page
+        return json.loads(result)
+
+    def unseen_forms(self, tables: List[Tuple[str, Union[Dict[str, str], str]]]) -> list:
+        """
+        :param tables: (table header, form) pairs from parse_tables
+        :return: Returns the forms of the tables whose headers haven't been seen before, which are added to table_set,
+        with defer_tables set the pairs are returned as they are for unseen_forms to be applied to later
+        """
+        if self.defer_tables:
+            return tables
+        return unseen_forms(tables, self.table_set)
+
+    def parse_html(self, word: str,
+                   html: bytes) -> Union[Dict[str, Union[str, List[str], List[Dict[str, str]]]], None]:
+        page = self.parse_tables(word, html)
+        if page is not None:
+            return {'word': word, 'forms': self.unseen_forms(page['tables']), 'definitions': page['definitions']}
         return None
 
 
@@ -205,6 +353,9 @@ class OETableWordScraper(OEWordScraper):
         self.table_parsing_key = table_parsing_key
         self.derived_terms_regex = r'Derived terms.*'
 
+    def parse_signature(self) -> tuple:
+        return super().parse_signature() + (self.table_regex.pattern, self.table_parsing_key, self.derived_terms_regex)
+
     def parse_forms(self, word: str, soup, form_dict: Dict[str, Union[str, List[str], List[Dict[str, str]]]]):
         header = soup.find_next('span', attrs={'id': self.table_regex})
 
@@ -225,12 +376,10 @@ class OETableWordScraper(OEWordScraper):
 
             for tbl in tables:
                 if re.match(self.derived_terms_regex, tbl.text) is None:
-                    if tbl.text not in self.table_set:
-                        self.table_set.add(tbl.text)
-                        tbl_tag = tbl.find_next('table')
+                    tbl_tag = tbl.find_next('table')
 
-                        data_dict = self.parse_table(tbl_tag, self.table_parsing_key)
-                        form_dict['forms'].append(data_dict)
+                    data_dict = self.parse_table(tbl_tag, self.table_parsing_key)
+                    form_dict['tables'].append((tbl.text, data_dict))
         else:
             debug('{} has no form table'.format(word))
 
@@ -301,6 +450,9 @@ class SoupAdjectiveScraper(OETableWordScraper):
                 self.table_parsing_key.append(('plural {} {}'.format(c, g), ci + 7, gi + 1))
                 self.single_table_key.append(('{} {}'.format(c, g), ci + 1, gi + 1))
 
+    def parse_signature(self) -> tuple:
+        return super().parse_signature() + (self.single_table_key, self.table_header_regex)
+
     def parse_forms(self, word: str, soup, form_dict: Dict[str, Union[str, List[str], List[Dict[str, str]]]]):
         header = soup.find_next('span', attrs={'id': self.table_regex})
 
@@ -321,108 +473,85 @@ class SoupAdjectiveScraper(OETableWordScraper):
 
             for tbl in tables:
                 if re.match(self.derived_terms_regex, tbl.text) is None:
-                    if tbl.text not in self.table_set:
-                        self.table_set.add(tbl.text)
+                    stren = 'none'
+                    match = re.match(self.table_header_regex, tbl.text)
+                    if match is not None:
+                        stren = match['strength']
 
-                        stren = 'none'
-                        match = re.match(self.table_header_regex, tbl.text)
-                        if match is not None:
-                            stren = match['strength']
+                    tbl_tag = tbl.find_next('table')
 
-                        tbl_tag = tbl.find_next('table')
-
-                        rows = tbl_tag.find_all('tr')
-                        if len(rows) > 6:
-                            data_dict = self.parse_table(tbl_tag, self.table_parsing_key)
-                        else:
-                            data_dict = self.parse_table(tbl_tag, self.single_table_key)
+                    rows = tbl_tag.find_all('tr')
+                    if len(rows) > 6:
+                        data_dict = self.parse_table(tbl_tag, self.table_parsing_key)
+                    else:
+                        data_dict = self.parse_table(tbl_tag, self.single_table_key)
 
-                        data_dict['strength'] = stren
-                        form_dict['forms'].append(data_dict)
+                    data_dict['strength'] = stren
+                    form_dict['tables'].append((tbl.text, data_dict))
         else:
             debug('{} has no form table'.format(word))
 
 
 class SoupHeaderScraper(OEWordScraper):
-    def parse_page(self, word: str, url: str) -> Union[List[str], None]:
-        resp = simple_get(url)
-        if resp is not None:
-            conjs = []
-            w_soup = BeautifulSoup(resp, 'html.parser')
+    @staticmethod
+    def table_outline(tbl_tag: BeautifulSoup) -> str:
+        """
+        :return: Returns the layout of a form table, its header cells are kept and its data cells replaced by _
+        """
+        conj = ''
+        rows = tbl_tag.find_all('tr')
+        for ri, r in enumerate(rows):
+            data = r.findAll(['th', 'td'])
+            for element in data:
+                if element.name == 'th':
+                    conj += element.text.replace('\n', '') + '\t'
+                else:
+                    conj += '_\t'
+            conj += '\n'
+        return conj
 
-            header = self.parse_definitions(w_soup, {})
+    def parse_forms(self, word: str, soup, form_dict: Dict[str, Union[str, List[str], List[Dict[str, str]]]]):
+        header = soup.find_next('span', attrs={'id': re.compile('(Conjugation|Declension|Inflection).*')})
 
-            if header is not None:
-                header = header.find_next('span', attrs={'id': re.compile('(Conjugation|Declension|Inflection).*')})
+        if header is not None:
+            tables = [tbl for tbl in header.find_all_next('div', attrs={'class': 'NavHead'})]
 
-                if header is not None:
-                    tables = [tbl for tbl in header.find_all_next('div', attrs={'class': 'NavHead'})]
+            next_span = header.find_next('span', attrs={'class': 'mw-headline'})
+            if next_span is not None:
+                spans_table = next_span.find_next('div', attrs={'class': 'NavHead'})
+                if spans_table is not None:
+                    new_tables = []
+                    for tbl in tables:
+                        if tbl.text == spans_table.text:
+                            break
+                        else:
+                            new_tables.append(tbl)
+                    tables = new_tables
 
-                    next_span = header.find_next('span', attrs={'class': 'mw-headline'})
-                    if next_span is not None:
-                        spans_table = next_span.find_next('div', attrs={'class': 'NavHead'})
-                        if spans_table is not None:
-                            new_tables = []
-                            for tbl in tables:
-                                if tbl.text == spans_table.text:
-                                    break
-                                else:
-                                    new_tables.append(tbl)
-                            tables = new_tables
+            for tbl in tables:
+                form_dict['tables'].append((tbl.text, self.table_outline(tbl.find_next('table'))))
+        else:
+            debug('{} has no forms table.'.format(word))
 
-                    for tbl in tables:
-                        conj = ''
-                        if tbl.text not in self.table_set:
-                            self.table_set.add(tbl.text)
-                            tbl_tag = tbl.find_next('table')
-                            rows = tbl_tag.find_all('tr')
-                            for ri, r in enumerate(rows):
-                                data = r.findAll(['th', 'td'])
-                                for element in data:
-                                    if element.name == 'th':
-                                        conj += element.text.replace('\n', '') + '\t'
-                                    else:
-                                        conj += '_\t'
-                                conj += '\n'
-                            conjs.append(conj)
-                    return conjs if len(conjs) > 0 else None
-                else:
-                    debug('{} has no forms table.'.format(word))
-            else:
-                debug('{} is not in old english'.format(word))
+    def parse_html(self, word: str, html: bytes) -> Union[List[str], None]:
+        page = self.parse_tables(word, html)
+        if page is not None:
+            conjs = self.unseen_forms(page['tables'])
+            return conjs if len(conjs) > 0 else None
         return None
 
     def find_words(self):
         if self.soup is not None:
-            tpc = self.get_paqe_count()
-
             self.word_list = []
             word_set = set()
-            page_soup = self.soup
-            for p in range(tpc if self.all_pages else 1):
-                next_link = page_soup.find('a', text='next page')
-                if next_link is not None:
-                    next_url = wiktionary_root + '/' + next_link['href']
-                else:
-                    next_url = None
-
-                lis = self.find_element_items(page_soup)
-                for li in tqdm(lis, desc='Page {}'.format(p + 1)):
-                    link = li.find('a').get('href')
-                    page = wiktionary_root + '/' + link
-                    declensions = self.parse_page(li.text, page)
+            for p, links in self.category_pages():
+                for word, html in tqdm(self.fetch_pages(links), total=len(links), desc='Page {}'.format(p + 1)):
+                    declensions = self.parse_html(word, html) if html is not None else None
                     if declensions is not None:
                         for decl in declensions:
                             if decl not in word_set:
                                 word_set.add(decl)
-                                self.word_list.append((li.text, decl))
-                if next_url is not None:
-                    phtml = simple_get(next_url)
-                    if phtml is not None:
-                        page_soup = BeautifulSoup(phtml, 'html.parser')
-                    else:
-                        error('Failed to load the next page, finished {} of {}'.format(p + 1, tpc))
-                        break
+                                self.word_list.append((word, decl))
 
         return self.word_list
 
@@ -442,55 +571,32 @@ class SoupAdjectiveHeaderScraper(SoupHeaderScraper):
         super().__init__(url, r'Adjective.*', all_pages, initial_table_set)
         self.table_header_regex = r'Declension of .+ — (?P<strength>Strong|Weak)( only)?'
 
-    def parse_page(self, word: str, url: str) -> Union[List[str], None]:
-        resp = simple_get(url)
-        if resp is not None:
-            conjs = []
-            w_soup = BeautifulSoup(resp, 'html.parser')
+    def parse_signature(self) -> tuple:
+        return super().parse_signature() + (self.table_header_regex,)
 
-            pos_header = self.parse_definitions(w_soup, {})
-
-            if pos_header is not None:
-                header = pos_header.find_next('span', attrs={'id': re.compile('(Conjugation|Declension|Inflection).*')})
-
-                if header is not None:
-                    tables = [tbl for tbl in header.find_all_next('div', attrs={'class': 'NavHead'})]
+    def parse_forms(self, word: str, soup, form_dict: Dict[str, Union[str, List[str], List[Dict[str, str]]]]):
+        header = soup.find_next('span', attrs={'id': re.compile('(Conjugation|Declension|Inflection).*')})
 
-                    next_span = pos_header.find_next('h3')
-                    if next_span is not None:
-                        spans_table = next_span.find_next('div', attrs={'class': 'NavHead'})
-                        if spans_table is not None:
-                            new_tables = []
-                            for tbl in tables:
-                                if tbl.text == spans_table.text:
-                                    break
-                                else:
-                                    new_tables.append(tbl)
-                            tables = new_tables
+        if header is not None:
+            tables = [tbl for tbl in header.find_all_next('div', attrs={'class': 'NavHead'})]
 
+            next_span = soup.find_next('h3')
+            if next_span is not None:
+                spans_table = next_span.find_next('div', attrs={'class': 'NavHead'})
+                if spans_table is not None:
+                    new_tables = []
                     for tbl in tables:
-                        conj = ''
-                        match = re.match(self.table_header_regex, tbl.text)
-                        if match is not None and tbl.text not in self.table_set:
-                            self.table_set.add(tbl.text)
-                            tbl_tag = tbl.find_next('table')
-                            rows = tbl_tag.find_all('tr')
-                            for ri, r in enumerate(rows):
-                                data = r.findAll(['th', 'td'])
-                                for element in data:
-                                    if element.name == 'th':
-                                        conj += element.text.replace('\n', '') + '\t'
-                                    else:
-                                        conj += '_\t'
-                                conj += '\n'
-                            conjs.append(conj)
-
-                    return conjs if len(conjs) > 0 else None
-                else:
-                    debug('{} has no forms table.'.format(word))
-            else:
-                debug('{} is not in old english'.format(word))
-        return None
+                        if tbl.text == spans_table.text:
+                            break
+                        else:
+                            new_tables.append(tbl)
+                    tables = new_tables
+
+            for tbl in tables:
+                if re.match(self.table_header_regex, tbl.text) is not None:
+                    form_dict['tables'].append((tbl.text, self.table_outline(tbl.find_next('table'))))
+        else:
+            debug('{} has no forms table.'.format(word))
 
 
 if __name__ == '__main__':
@@ -0,0 +1,122 @@
+import os
+import os.path as path
+import time
+import zlib
+from typing import Tuple, Union
+
+from controllers.sql import ConnectionPool
+from controllers.ui import debug
+from settings import html_cache_path, html_cache_db, html_cache_compression, html_cache_max_age, fetch_workers
+from utils.web import prepare_filename
+
+
+# (body, fetched, etag, last modified)
+CacheEntry = Tuple[bytes, float, Union[str, None], Union[str, None]]
+
+
+class HTMLCache:
+    """
+    Stores downloaded pages compressed in a single sqlite file keyed by their full url, along with the validators
+    the server sent for them and what the scrapers parsed out of them,
+    every thread (and forked process) gets its own connection to it
+    """
+    instance = None
+
+    def __init__(self, db_path: str = html_cache_db, max_age: Union[float, None] = html_cache_max_age):
+        """
+        :param db_path: The file to keep the pages in
+        :param max_age: The number of seconds a page is used for before it is revalidated, None never revalidates
+        """
+        self.max_age = max_age
+
+        os.makedirs(path.dirname(db_path), exist_ok=True)
+        self.pool = ConnectionPool(db_path, fetch_workers)
+        conn = self.pool.acquire()
+        conn.execute('pragma journal_mode=wal')  # Lets readers carry on while another thread is storing a page
+        conn.execute('create table if not exists pages (url text primary key, body blob not null, '
+                     'fetched real not null, etag text, last_modified text)')
+        conn.execute('create table if not exists parsed_pages (key text primary key, result blob not null)')
+
+        # Stores made before pages kept their validators
+        columns = [c[1] for c in conn.execute('pragma table_info(pages)').fetchall()]
+        for column in ['etag', 'last_modified']:
+            if column not in columns:
+                conn.execute('alter table pages add column {} text'.format(column))
+        conn.commit()
+
+    @staticmethod
+    def get_instance():
+        if HTMLCache.instance is None:
+            HTMLCache.instance = HTMLCache()
+        return HTMLCache.instance
+
+    def entry(self, url: str) -> Union[CacheEntry, None]:
+        """
+        :param url: The url of the page
+        :return: Returns the cached page, or None if it hasn't been stored, pages that are only in the old
+        one file per page cache are moved into the store the first time they're asked for
+        """
+        row = self.pool.acquire().execute('select body, fetched, etag, last_modified from pages where url = ?',
+                                          (url,)).fetchone()
+        if row is not None:
+            return (zlib.decompress(row[0]),) + tuple(row[1:])
+
+        fpath = path.join(html_cache_path, prepare_filename(url))
+        if path.exists(fpath):
+            debug('Importing {} into the html cache'.format(fpath))
+            with open(fpath, 'rb') as fp:
+                html = fp.read()
+            fetched = path.getmtime(fpath)
+            self.put(url, html, fetched)
+            return html, fetched, None, None
+        return None
+
+    def get(self, url: str) -> Union[bytes, None]:
+        entry = self.entry(url)
+        return entry[0] if entry is not None else None
+
+    def fresh(self, entry: CacheEntry) -> bool:
+        """
+        :return: Returns True if the entry can be used without asking the server whether it changed
+        """
+        return self.max_age is None or time.time() - entry[1] < self.max_age
+
+    def put(self, url: str, html: bytes, fetched: Union[float, None] = None,
+            etag: Union[str, None] = None, last_modified: Union[str, None] = None):
+        """
+        :param url: The url of the page
+        :param html: The body of the page
+        :param fetched: When the page was downloaded, defaults to now
+        :param etag: The ETag header the page was served with
+        :param last_modified: The Last-Modified header the page was served with
+        """
+        conn = self.pool.acquire()
+        conn.execute('insert or replace into pages (url, body, fetched, etag, last_modified) values (?, ?, ?, ?, ?)',
+                     (url, zlib.compress(html, html_cache_compression), time.time() if fetched is None else fetched,
+                      etag, last_modified))
+        conn.commit()
+
+    def revalidated(self, url: str):
+        """
+        Marks the page as current, for when the server answered a conditional request with 304 Not Modified
+        """
+        conn = self.pool.acquire()
+        conn.execute('update pages set fetched = ? where url = ?', (time.time(), url))
+        conn.commit()
+
+    def parsed(self, key: str) -> Union[str, None]:
+        """
+        :param key: The hash of a page and the scraper settings it was parsed with
+        :return: Returns the json the scraper stored for the key, or None if it hasn't parsed the page yet
+        """
+        row = self.pool.acquire().execute('select result from parsed_pages where key = ?', (key,)).fetchone()
+        return zlib.decompress(row[0]).decode('utf8') if row is not None else None
+
+    def put_parsed(self, key: str, result: str):
+        conn = self.pool.acquire()
+        conn.execute('insert or replace into parsed_pages (key, result) values (?, ?)',
+                     (key, zlib.compress(result.encode('utf8'), html_cache_compression)))
+        conn.commit()
+
+    def close(self):
+        self.pool.close()
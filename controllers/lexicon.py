@@ -0,0 +1,223 @@
+from contextlib import contextmanager
+from typing import Dict, List, Tuple, Union
+
+from controllers.sql import SQLController
+from controllers.ui import debug
+from controllers.paradigm import paradigm_tables, paradigm_features, paradigm_cells, cell_positions, cell_key
+from settings import use_lexicon
+
+
+def _wildcards(key: tuple) -> List[tuple]:
+    """
+    :param key: The optional parts of a lookup key
+    :return: Returns every copy of key with any combination of its entries replaced by None,
+    so that a lookup that leaves a field unconstrained is still a single dictionary hit
+    """
+    variants = [()]
+    for k in key:
+        variants = [v + (k,) for v in variants] + [v + (None,) for v in variants]
+    return list(dict.fromkeys(variants))  # NULL columns would otherwise be filed twice
+
+
+class Lexicon:
+    """
+    Read-only snapshot of the word tables, rows are returned in the same shape the equivalent
+    SQLController.select_conditional call would return them in, features are keyed by their codes
+    """
+    instance = None
+    enabled = use_lexicon
+    scoped = None
+
+    def __init__(self, ids: Union[List[int], None] = None):
+        """
+        :param ids: If given, only the roots with these ids and their forms are loaded
+        """
+        self.complete = ids is None
+        # The version of the database the snapshot was loaded from
+        self.data_version = SQLController.get_instance().data_version
+
+        # (name, pos) -> ids
+        self.names: Dict[Tuple[str, str], List[int]] = {}
+        # id -> (definition,)
+        self.definitions: Dict[int, Tuple[str]] = {}
+        # pos -> (id, name) of the roots that aren't affixes
+        self.roots: Dict[str, List[Tuple[int, str]]] = {}
+
+        # (origin, noun_case, plurality | None) -> [(word,)]
+        self.declensions: Dict[tuple, List[Tuple[str]]] = {}
+        # origin -> [(plurality, noun_case)]
+        self.declension_forms: Dict[int, List[Tuple[str, str]]] = {}
+
+        # (origin, mood, participle, is_infinitive, plurality | None, person | None, tense | None) -> [(word,)]
+        self.conjugations: Dict[tuple, List[Tuple[str]]] = {}
+        # origin -> [(plurality, tense, mood, person, participle, is_infinitive)]
+        self.conjugation_forms: Dict[int, List[tuple]] = {}
+
+        # (origin, strength, noun_case, plurality | None, gender | None) -> [(word,)]
+        self.adjectives: Dict[tuple, List[Tuple[str]]] = {}
+        # origin -> [(strength, gender, plurality, noun_case)]
+        self.adjective_forms: Dict[int, List[tuple]] = {}
+
+        self.load(ids)
+
+    @staticmethod
+    def get_instance():
+        if Lexicon.instance is None:
+            Lexicon.instance = Lexicon()
+        return Lexicon.instance
+
+    @staticmethod
+    def enable():
+        Lexicon.enabled = True
+
+    @staticmethod
+    def disable():
+        Lexicon.enabled = False
+
+    @staticmethod
+    def active() -> Union['Lexicon', None]:
+        """
+        :return: Returns the lexicon if the grammar classes should resolve through it, otherwise None
+        """
+        if Lexicon.scoped is not None:
+            return Lexicon.scoped
+        return Lexicon.get_instance() if Lexicon.enabled else None
+
+    @staticmethod
+    @contextmanager
+    def scope(lex: 'Lexicon'):
+        """
+        Makes the grammar classes resolve through lex for the duration of the with block
+        """
+        previous = Lexicon.scoped
+        Lexicon.scoped = lex
+        try:
+            yield lex
+        finally:
+            Lexicon.scoped = previous
+
+    @staticmethod
+    def for_words(words: list) -> 'Lexicon':
+        """
+        :param words: Noun, Verb, Adjective, or Adverb objects
+        :return: Returns a lexicon holding only the given words, loaded with one query per table,
+        the words are loaded by their ids since a word can be drawn with the id of a root of another part of speech
+        """
+        ids = set()
+        for w in words:
+            ids.update(w.index)
+        return Lexicon(sorted(ids))
+
+    def _select(self, table: str, query: str, column: str, values: Union[List, None]) -> list:
+        cont = SQLController.get_instance()
+        if values is None:
+            return cont.select(table, query)
+        return cont.select_in(table, query, column, values)
+
+    def _forms(self, pos: str, origins: Union[List[int], None]) -> List[tuple]:
+        """
+        :return: Returns the (origin, word, paradigm_features...) rows of pos's form table, in the order of
+        controllers.paradigm.form_order so a lookup that leaves a feature unset finds the same form first
+        """
+        rows = self._select(paradigm_tables[pos], 'id, origin, word, ' + ', '.join(paradigm_features[pos]),
+                            'origin', origins)
+        missing = len(paradigm_cells[pos])
+
+        def order(row: tuple) -> tuple:
+            cell = cell_positions[pos].get(cell_key(pos, row[3:]))
+            return row[1], missing if cell is None else cell, row[0]
+
+        return [row[1:] for row in sorted(rows, key=order)]
+
+    def load(self, ids: Union[List[int], None] = None):
+        if ids is None:
+            debug('Loading lexicon')
+        rows = self._select('old_english_words', 'id, name, pos, definition, is_affix', 'id', ids)
+
+        for index, name, pos, definition, is_affix in rows:
+            self.names.setdefault((name, pos), []).append(index)
+            self.definitions[index] = (definition,)
+            if not is_affix:
+                self.roots.setdefault(pos, []).append((index, name))
+
+        origins = None if ids is None else list(self.definitions.keys())
+
+        for origin, word, case, plurality in self._forms('noun', origins):
+            row = (word,)
+            for p, in _wildcards((plurality,)):
+                self.declensions.setdefault((origin, case, p), []).append(row)
+            self.declension_forms.setdefault(origin, []).append((plurality, case))
+
+        for origin, word, mood, tense, person, plurality, participle, infinitive in self._forms('verb', origins):
+            row = (word,)
+            for pl, per, t in _wildcards((plurality, person, tense)):
+                self.conjugations.setdefault((origin, mood, participle, infinitive, pl, per, t), []).append(row)
+            self.conjugation_forms.setdefault(origin, []).append((plurality, tense, mood, person,
+                                                                  participle, infinitive))
+
+        for origin, word, strength, case, plurality, gender in self._forms('adjective', origins):
+            row = (word,)
+            for p, g in _wildcards((plurality, gender)):
+                self.adjectives.setdefault((origin, strength, case, p, g), []).append(row)
+            self.adjective_forms.setdefault(origin, []).append((strength, gender, plurality, case))
+
+        if ids is None:
+            debug('Lexicon loaded {} words'.format(len(self.definitions)))
+
+    @staticmethod
+    def reload():
+        Lexicon.instance = Lexicon()
+
+    @staticmethod
+    def check_version(version: tuple):
+        """
+        Drops the snapshot if it was loaded from an older version of the database, it's loaded again on next use
+        """
+        if Lexicon.instance is not None and Lexicon.instance.data_version != version:
+            debug('Database changed, dropping the lexicon')
+            Lexicon.instance = None
+
+    def indices(self, root: str, pos: str) -> List[Tuple[int]]:
+        return [(i,) for i in self.names.get((root, pos), [])]
+
+    def meanings(self, indices: List[int]) -> List[Tuple[str]]:
+        return [self.definitions[i] for i in indices if i in self.definitions]
+
+    def declension(self, indices: List[int], case: str, plurality: Union[str, None]) -> List[Tuple[str]]:
+        result = []
+        for i in sorted(indices):
+            result += self.declensions.get((i, case, plurality), [])
+        return result
+
+    def possible_declensions(self, indices: List[int]) -> List[Tuple[str, str]]:
+        result = []
+        for i in indices:
+            result += self.declension_forms.get(i, [])
+        return result
+
+    def conjugation(self, indices: List[int], mood: str, participle: int, infinitive: int,
+                    plurality: Union[str, None], person: Union[str, None],
+                    tense: Union[str, None]) -> List[Tuple[str]]:
+        result = []
+        for i in sorted(indices):
+            result += self.conjugations.get((i, mood, participle, infinitive, plurality, person, tense), [])
+        return result
+
+    def possible_conjugations(self, indices: List[int]) -> List[tuple]:
+        result = []
+        for i in indices:
+            result += self.conjugation_forms.get(i, [])
+        return result
+
+    def adjective_declension(self, indices: List[int], strength: int, case: str,
+                             plurality: Union[str, None], gender: Union[str, None]) -> List[Tuple[str]]:
+        result = []
+        for i in sorted(indices):
+            result += self.adjectives.get((i, strength, case, plurality, gender), [])
+        return result
+
+    def possible_adjective_declensions(self, indices: List[int]) -> List[tuple]:
+        result = []
+        for i in indices:
+            result += self.adjective_forms.get(i, [])
+        return result
@@ -0,0 +1,185 @@
+import json
+import zlib
+from array import array
+from functools import lru_cache
+from itertools import product
+from typing import Dict, Iterable, List, Tuple, Union
+
+from controllers.sql import SQLController, placeholders
+from utils.grammar import feature_columns
+
+
+# The table each part of speech's forms are in, and the columns that pick out a cell of its paradigm,
+# a lookup that matches several forms returns them ordered by root id, then cell, then row id (see form_order)
+paradigm_tables = {
+    'noun': 'declensions',
+    'verb': 'conjugations',
+    'adjective': 'adjectives'
+}
+paradigm_features = {
+    'noun': ('noun_case', 'plurality'),
+    'verb': ('mood', 'tense', 'person', 'plurality', 'participle', 'is_infinitive'),
+    'adjective': ('strength', 'noun_case', 'plurality', 'gender')
+}
+
+# The features a lookup can leave unconstrained, any cell with one of their values matches
+wildcard_features = {'plurality', 'person', 'tense', 'gender'}
+
+
+def feature_values(feature: str) -> List[int]:
+    """
+    :return: Returns every code a cell can have for the feature, in the order the cells are laid out in
+    """
+    if feature not in feature_columns:
+        return [0, 1]
+    return sorted(m.value for m in feature_columns[feature] if m.name != 'ROOT')
+
+
+# Every cell of each part of speech's paradigm, in order, and where each of them is
+paradigm_cells: Dict[str, List[tuple]] = {pos: list(product(*[feature_values(f) for f in features]))
+                                          for pos, features in paradigm_features.items()}
+cell_positions: Dict[str, Dict[tuple, int]] = {pos: {c: i for i, c in enumerate(cells)}
+                                               for pos, cells in paradigm_cells.items()}
+
+
+def form_order(pos: str) -> str:
+    """
+    :return: Returns the order by clause that sorts the rows of pos's form table the way the paradigms lay them out,
+    by root, then by cell, with features that weren't recognised in the NONE cell, then by row
+    """
+    columns = ['coalesce({}, {})'.format(f, feature_columns[f].NONE.value) if f in wildcard_features else f
+               for f in paradigm_features[pos]]
+    return ', '.join(['origin'] + columns + ['id'])
+
+
+def cell_key(pos: str, row: tuple) -> Union[tuple, None]:
+    """
+    :param pos: The part of speech of the row
+    :param row: The values of the row's paradigm_features columns
+    :return: Returns the cell the row fills, or None if it can't be looked up, features that weren't recognised
+    are filed with NONE if a lookup can leave them out, since then they're only ever matched by leaving them out
+    """
+    key = []
+    for feature, value in zip(paradigm_features[pos], row):
+        if value is None:
+            if feature not in wildcard_features:
+                return None
+            value = feature_columns[feature].NONE.value
+        key.append(value)
+    return tuple(key)
+
+
+def pack_paradigm(pos: str, rows: Iterable[tuple]) -> Tuple[str, bytes]:
+    """
+    :param pos: The part of speech of the root
+    :param rows: The (word, paradigm_features...) rows of the root, the first form for a cell is kept
+    :return: Returns the root's forms as a json list, and its cells as an array of the 1-based position of their
+    form in that list, 0 marks a cell the root doesn't have, the cells are left uncompressed so a lookup is only a copy
+    """
+    filled = {}
+    for word, *features in rows:
+        cell = cell_positions[pos].get(cell_key(pos, tuple(features)))
+        if cell is not None and cell not in filled:
+            filled[cell] = word
+
+    # The forms are listed in the order of the cells they first fill, so the row doesn't depend on the row ids
+    forms = []
+    positions = {}
+    cells = array('H', bytes(2 * len(paradigm_cells[pos])))
+    for cell, word in sorted(filled.items()):
+        if word not in positions:
+            forms.append(word)
+            positions[word] = len(forms)
+        cells[cell] = positions[word]
+    return json.dumps(forms, ensure_ascii=False), cells.tobytes()
+
+
+def unpack_paradigm(pos: str, forms: str, cells: bytes) -> Tuple[List[str], array]:
+    unpacked = array('H')
+    if len(cells) != 2 * len(paradigm_cells[pos]):
+        # Paradigms were zlib compressed when they were first added
+        cells = zlib.decompress(cells)
+    unpacked.frombytes(cells)
+    return json.loads(forms), unpacked
+
+
+@lru_cache(maxsize=None)
+def key_positions(pos: str, key: tuple) -> Tuple[int, ...]:
+    """
+    :return: Returns the positions of the cells that match key, see Paradigms.expand
+    """
+    return tuple(cell_positions[pos][c] for c in Paradigms.expand(pos, key) if c in cell_positions[pos])
+
+
+class Paradigms:
+    """
+    Looks up the forms of roots in the paradigms table, where each root's whole paradigm is a single row,
+    rows are unpacked once and kept until the database changes
+    """
+    instance = None
+
+    def __init__(self):
+        # (pos, origin) -> (forms, cells), None for a root without a row
+        self.rows: Dict[Tuple[str, int], Union[Tuple[List[str], array], None]] = {}
+        # Whether the database has a paradigms table at all
+        self.built = False
+        self.data_version = None
+
+    @staticmethod
+    def get_instance():
+        if Paradigms.instance is None:
+            Paradigms.instance = Paradigms()
+        return Paradigms.instance
+
+    @staticmethod
+    def expand(pos: str, key: tuple) -> List[tuple]:
+        """
+        :param key: The values of the paradigm_features, None for a feature the lookup leaves unconstrained
+        :return: Returns every cell that matches key, in paradigm order
+        """
+        options = [feature_values(f) if v is None else [v] for f, v in zip(paradigm_features[pos], key)]
+        return list(product(*options))
+
+    def _check_version(self):
+        version = SQLController.get_instance().data_version
+        if version != self.data_version:
+            self.rows = {}
+            # Databases that haven't been migrated yet don't have the table, their lookups go to the form tables
+            self.built = len(SQLController.get_instance().select_conditional(
+                'sqlite_master', 'name', "type = 'table' and name = 'paradigms'")) > 0
+            self.data_version = version
+
+    def forms(self, pos: str, indices: Iterable[int], key: tuple) -> Union[List[Tuple[str]], None]:
+        """
+        :param pos: The part of speech of the root
+        :param indices: The ids of the root
+        :param key: The values of the paradigm_features, None for a feature the lookup leaves unconstrained
+        :return: Returns the forms in the matching cells as (word,) rows, the same way selecting them from the
+        form table would, or None if the paradigms haven't been built for the root
+        """
+        self._check_version()
+        if not self.built:
+            return None
+        indices = tuple(indices)
+        missing = tuple(i for i in indices if (pos, i) not in self.rows)
+        if len(missing) > 0:
+            rows = SQLController.get_instance().select_conditional('paradigms', 'origin, forms, cells',
+                                                                   'pos = ? and origin in ({})'.format(
+                                                                       placeholders(len(missing))),
+                                                                   (pos,) + missing)
+            if rows is None:
+                return None
+            for origin, forms, cells in rows:
+                self.rows[(pos, origin)] = unpack_paradigm(pos, forms, cells)
+            for i in missing:
+                self.rows.setdefault((pos, i), None)
+
+        paradigms = [self.rows[(pos, i)] for i in sorted(indices) if self.rows[(pos, i)] is not None]
+        if len(paradigms) == 0:
+            return None
+
+        positions = key_positions(pos, key)
+        result = []
+        for forms, cells in paradigms:
+            result += [(forms[cells[p] - 1],) for p in positions if cells[p] > 0]
+        return result
@@ -1,62 +1,310 @@
+import atexit
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
+from functools import lru_cache
+from itertools import islice
 from sqlite3 import Error
-from typing import List
+from typing import Iterable, List, Union
 
-from settings import database_path
-from schemas import schemas, record_typing, triggers, views
+from controllers.ui import error
+from settings import database_path, persistent_connections, connection_pool_size, statement_cache_size, \
+    insert_chunk_size
+from schemas import schemas, record_typing, triggers, views, indices, staged_links
+
+
+max_host_parameters = 999  # SQLITE_MAX_VARIABLE_NUMBER on older sqlite builds
+
+
+@lru_cache(maxsize=None)
+def placeholders(count: int) -> str:
+    """
+    :param count: The number of values to bind
+    :return: Returns a comma separated list of count ? placeholders, ie. for use in an 'in (...)' clause
+    """
+    return ', '.join(['?'] * count)
+
+
+def connect_database(db_path: str, **kwargs) -> sqlite3.Connection:
+    # Every connection gets a statement cache large enough to hold all of the query templates we use
+    return sqlite3.connect(db_path, cached_statements=statement_cache_size, **kwargs)
+
+
+class PooledConnection:
+    """
+    A thread's hold on one of the pool's connections, kept in the thread's locals so that the connection goes back
+    to the pool when the thread exits, or when it's released explicitly
+    """
+    def __init__(self, pool: 'ConnectionPool', conn: sqlite3.Connection):
+        self.pool = pool
+        self.conn = conn
+        self.pid = os.getpid()
+
+    def release(self):
+        if self.conn is not None and self.pid == os.getpid():
+            self.pool.give_back(self.conn)
+        self.conn = None
+
+    def __del__(self):
+        self.release()
+
+
+class ConnectionPool:
+    """
+    Hands out one long-lived connection per thread,
+    connections that are released, or whose thread has exited, are kept around (up to size of them)
+    for the next thread that asks, any more than that are closed
+    """
+    def __init__(self, db_path: str, size: int):
+        self.db_path = db_path
+        self.size = size
+        self._local = threading.local()
+        self._idle: List[sqlite3.Connection] = []
+        self._open: List[sqlite3.Connection] = []
+        # Reentrant since dropping a thread's locals while holding it gives the thread's connection back
+        self._lock = threading.RLock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # Connections can't be shared with a forked child, so it starts with an empty pool
+        if self._pid != os.getpid():
+            self._local = threading.local()
+            self._idle = []
+            self._open = []
+            self._lock = threading.RLock()
+            self._pid = os.getpid()
+
+    def acquire(self) -> sqlite3.Connection:
+        self._check_fork()
+        held = getattr(self._local, 'held', None)
+        if held is None:
+            with self._lock:
+                if len(self._idle) > 0:
+                    conn = self._idle.pop()
+                else:
+                    conn = connect_database(self.db_path, check_same_thread=False)
+                    self._open.append(conn)
+            held = PooledConnection(self, conn)
+            self._local.held = held
+        return held.conn
+
+    def release(self):
+        """
+        Gives the calling thread's connection back to the pool
+        """
+        held = getattr(self._local, 'held', None)
+        if held is not None:
+            self._local.held = None
+            held.release()
+
+    def give_back(self, conn: sqlite3.Connection):
+        with self._lock:
+            if conn not in self._open:
+                return  # The pool was closed since the connection was handed out
+            if len(self._idle) < self.size:
+                if conn.in_transaction:
+                    conn.rollback()
+                self._idle.append(conn)
+            else:
+                self._open.remove(conn)
+                conn.close()
+
+    def close(self):
+        self._check_fork()
+        with self._lock:
+            for conn in self._open:
+                conn.close()
+            self._open = []
+            self._idle = []
+            self._local = threading.local()
 
 
 class SQLController:
     instance = None
 
     def __init__(self):
-        self.conn = None
+        self._conn = None
+        self.pool: Union[ConnectionPool, None] = None
+        self.writes = 0
+        # Connections are per thread, and so are the transactions open on them
+        self._transactions = threading.local()
+        # The modification time data_version reports while the version is pinned
+        self._pinned = None
+        if persistent_connections:
+            self.open_pool()
 
     @staticmethod
     def get_instance():
         if SQLController.instance is None:
             SQLController.instance = SQLController()
+            atexit.register(SQLController.shutdown)
         return SQLController.instance
 
     @staticmethod
-    def reset_database():
+    def shutdown():
+        if SQLController.instance is not None:
+            SQLController.instance.close_pool()
+
+    @staticmethod
+    def reset_database(with_indices: bool = True):
         SQLController.delete_db()
-        SQLController.get_instance().setup_tables()
+        SQLController.get_instance().setup_tables(with_indices)
 
     @staticmethod
     def delete_db():
-        import os
-        os.remove(database_path)
+        if SQLController.instance is not None and SQLController.instance.pool is not None:
+            SQLController.instance.pool.close()
+        if os.path.exists(database_path):
+            os.remove(database_path)
 
-    def execute_query(self, query: str):
-        cursor = self.conn.cursor()
+    @property
+    def data_version(self) -> tuple:
+        """
+        :return: Returns a value that changes whenever the database is modified,
+        either through this controller or by another process
+        """
+        if self._pinned is not None:
+            return self.writes, self._pinned
+        return self.writes, self._modified()
+
+    @staticmethod
+    def _modified() -> int:
+        try:
+            return os.stat(database_path).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    @contextmanager
+    def pinned_version(self):
+        """
+        Checks the database file for changes once for the with block instead of on every data_version call,
+        for generating a batch of words, writes made through the controller still change the version
+        """
+        if self._pinned is not None:
+            yield self
+            return
+
+        self._pinned = self._modified()
         try:
-            cursor.execute(query)
+            yield self
+        finally:
+            self._pinned = None
+
+    @property
+    def in_transaction(self) -> bool:
+        """
+        :return: Returns True if the calling thread is inside a transaction() block
+        """
+        return getattr(self._transactions, 'open', False)
+
+    @property
+    def conn(self) -> Union[sqlite3.Connection, None]:
+        if self.pool is not None:
+            return self.pool.acquire()
+        return self._conn
+
+    def open_pool(self, size: int = connection_pool_size):
+        if self.pool is None:
+            self.pool = ConnectionPool(database_path, size)
+
+    def close_pool(self):
+        if self.pool is not None:
+            self.pool.close()
+            self.pool = None
+
+    @contextmanager
+    def pooled(self, size: int = connection_pool_size):
+        """
+        Keeps connections open for the duration of the with block,
+        if the pool was already open it is left open afterwards
+        """
+        opened = self.pool is None
+        self.open_pool(size)
+        try:
+            yield self
+        finally:
+            if opened:
+                self.close_pool()
+
+    @contextmanager
+    def transaction(self):
+        """
+        Groups every write made by the calling thread in the with block into a single commit,
+        which is rolled back instead if an exception escapes the block, errors raised by execute_query and
+        execute_many inside the block are passed on so that a write that failed halfway isn't committed
+        """
+        if self.in_transaction:
+            yield self
+            return
+
+        with self.pooled():
+            self._transactions.open = True
+            try:
+                if not self.conn.in_transaction:
+                    # Opened explicitly so that savepoints made inside the block nest within it
+                    self.conn.execute('begin')
+                yield self
+                self.conn.commit()
+            except BaseException:
+                self.conn.rollback()
+                raise
+            finally:
+                self._transactions.open = False
+
+    def commit(self):
+        if not self.in_transaction:
             self.conn.commit()
+        self.writes += 1
+
+    def execute_query(self, query: str, parameters: tuple = ()):
+        cursor = self.conn.cursor()
+        try:
+            cursor.execute(query, parameters)
+            self.commit()
         except Error as e:
+            if self.in_transaction:
+                raise
             print('An Error occurred: {}'.format(e))
 
-    def execute_read_query(self, query: str):
+    def execute_many(self, query: str, records: List[tuple]):
+        cursor = self.conn.cursor()
+        try:
+            cursor.executemany(query, records)
+            self.commit()
+        except Error as e:
+            if self.in_transaction:
+                raise
+            print('An Error occurred: {}'.format(e))
+
+    def execute_read_query(self, query: str, parameters: tuple = ()):
         cursor = self.conn.cursor()
         result = None
         try:
-            cursor.execute(query)
+            cursor.execute(query, parameters)
             result = cursor.fetchall()
             return result
         except Error as e:
             print('An Error occurred: {}'.format(e))
 
     def connect(self):
+        if self.pool is not None:
+            return
         try:
-            self.conn = sqlite3.connect(database_path)
+            self._conn = connect_database(database_path)
         except Error as e:
             print('An Error occurred: {}'.format(e))
 
     def disconnect(self):
-        if self.conn is not None:
-            self.conn.close()
+        if self.pool is None and self._conn is not None:
+            self._conn.close()
+            self._conn = None
 
-    def setup_tables(self):
+    def setup_tables(self, with_indices: bool = True):
+        """
+        :param with_indices: Whether to create the lookup indices as well,
+        when bulk loading a new database it's faster to leave them out and call create_indices afterwards
+        """
         self.connect()
         for schema in schemas:
             query = 'create table if not exists {}'.format(schema)
@@ -68,17 +316,103 @@ class SQLController:
             query = 'create view if not exists {}'.format(view)
             self.execute_query(query)
         self.disconnect()
+        if with_indices:
+            self.create_indices()
 
-    def insert_record(self, table: str, records: List[tuple]):
+    def create_indices(self, tables: Union[List[str], None] = None):
+        """
+        :param tables: If given, only the indices on these tables are created
+        """
         self.connect()
-        query = 'insert into {} {} values {}'.format(table, record_typing[table],
-                                                     ','.join(['({})'.format(', '.join(map(str, r))) for r in records]))
-        self.execute_query(query)
+        for index in indices:
+            if tables is None or index.split(' ')[2] in tables:
+                self.execute_query('create index if not exists {}'.format(index))
+        self.execute_query('analyze')
         self.disconnect()
 
-    def delete_record(self, table: str, identifier: str):
+    def drop_indices(self):
         self.connect()
-        self.execute_query('delete from {} where {}'.format(table, identifier))
+        for index in indices:
+            self.execute_query('drop index if exists {}'.format(index.split(' ')[0]))
+        self.disconnect()
+
+    def insert_record(self, table: str, records: Iterable[tuple], columns: Union[str, None] = None,
+                      chunk_size: int = insert_chunk_size) -> int:
+        """
+        Inserts the records chunk_size at a time inside a single transaction,
+        a chunk that fails is rolled back and reported on its own without losing the others
+        :param table: The table to insert into
+        :param records: The rows to insert, any iterable works so they don't have to be built up front
+        :param columns: The columns the rows fill, defaults to the table's entry in record_typing
+        :param chunk_size: The number of rows handed to each executemany call
+        :return: Returns the number of rows written
+        """
+        columns = columns if columns is not None else record_typing[table]
+        query = 'insert into {} {} values ({})'.format(table, columns, placeholders(columns.count(',') + 1))
+
+        records = iter(records)
+        written = 0
+        with self.transaction():
+            cursor = self.conn.cursor()
+            for ci, chunk in enumerate(iter(lambda: list(islice(records, chunk_size)), [])):
+                cursor.execute('savepoint insert_chunk')
+                try:
+                    cursor.executemany(query, chunk)
+                    written += len(chunk)
+                except Error as e:
+                    cursor.execute('rollback to insert_chunk')
+                    error('Chunk {} ({} rows) of the insert into {} failed: {}'.format(ci, len(chunk), table, e))
+                cursor.execute('release insert_chunk')
+            self.commit()
+        return written
+
+    def create_staging_table(self, table: str):
+        """
+        Creates a temporary table, staged_<table>, with the same columns as table but no constraints,
+        the staging tables only live as long as the connection so this should be used inside pooled()
+        """
+        self.execute_query('create temp table if not exists staged_{} {}'.format(table, record_typing[table]))
+
+    def link_staged(self, table: str, staged: Union[str, None] = None, names: Union[str, None] = None) -> int:
+        """
+        Copies the rows of a staging table into table, swapping the root names in them for the roots' ids.
+        When a name belongs to several roots the first one with the part of speech given in staged_links is
+        preferred, otherwise the first root with that name is used
+        :param table: The table to link the staged rows into
+        :param staged: The table holding the rows, defaults to staged_<table> which is dropped once it's linked,
+        any other table is left as it is
+        :param names: If given, a table with a name column, only the staged rows that refer to one of its names
+        are linked
+        :return: Returns the number of staged rows whose root couldn't be found
+        """
+        name_column, pos = staged_links[table]
+        columns = record_typing[table][1:-1].split(', ')
+        selection = ', '.join(['root_links.id' if c == name_column else 'staged.' + c for c in columns])
+        source = staged if staged is not None else 'staged_{}'.format(table)
+        named = 'staged.{} in (select name from {})'.format(name_column, names) if names is not None else '1'
+
+        with self.transaction():
+            self.execute_query('drop table if exists temp.root_links')
+            self.execute_query('create temp table root_links (name text primary key, id integer not null)')
+            self.execute_query('insert into root_links select name, id from ('
+                               'select name, id, row_number() over (partition by name order by pos != ?, id) as rank '
+                               'from old_english_words where name in (select {} from {} as staged where {})'
+                               ') where rank = 1'.format(name_column, source, named), (pos,))
+            self.execute_query('insert into {} {} select {} from {} as staged '
+                               'join root_links on root_links.name = staged.{} where {} '
+                               'order by staged.rowid'.format(table, record_typing[table], selection, source,
+                                                              name_column, named))
+            unlinked = self.select_conditional('{} as staged'.format(source), 'count(*)',
+                                               '{} and staged.{} not in (select name from root_links)'.format(
+                                                   named, name_column))[0][0]
+            if staged is None:
+                self.execute_query('drop table {}'.format(source))
+            self.execute_query('drop table root_links')
+        return unlinked
+
+    def delete_record(self, table: str, identifier: str, parameters: tuple = ()):
+        self.connect()
+        self.execute_query('delete from {} where {}'.format(table, identifier), parameters)
         self.disconnect()
 
     def delete_all(self, table: str):
@@ -86,19 +420,51 @@ class SQLController:
         self.execute_query('delete from {}'.format(table))
         self.disconnect()
 
-    def select(self, table: str, query: str):
+    def select(self, table: str, query: str, parameters: tuple = ()):
         self.connect()
-        result = self.execute_read_query('select {} from {}'.format(query, table))
+        result = self.execute_read_query('select {} from {}'.format(query, table), parameters)
         self.disconnect()
         return result
 
-    def select_conditional(self, table: str, query: str, conditional: str):
+    def select_conditional(self, table: str, query: str, conditional: str, parameters: tuple = ()):
+        """
+        :param table: The table (or join) to select from
+        :param query: The columns to select
+        :param conditional: The where clause, values should be given as ? placeholders
+        :param parameters: The values bound to the placeholders in conditional
+        :return: Returns the selected rows
+        """
         self.connect()
-        result = self.execute_read_query('select {} from {} where {}'.format(query, table, conditional))
+        result = self.execute_read_query('select {} from {} where {}'.format(query, table, conditional), parameters)
         self.disconnect()
         return result
 
-    def update_record(self, table: str, modification: str, conditional: str):
+    def select_in(self, table: str, query: str, column: str, values: list,
+                  conditional: str = '', parameters: tuple = ()) -> list:
+        """
+        Selects every row where column is one of values,
+        the values are bound in chunks that fit under SQLite's host parameter limit
+        :param table: The table (or join) to select from
+        :param query: The columns to select
+        :param column: The column to match against values
+        :param values: The values to match
+        :param conditional: An extra where clause that all of the rows must satisfy
+        :param parameters: The values bound to the placeholders in conditional
+        :return: Returns the selected rows
+        """
+        chunk_size = max_host_parameters - len(parameters)
+        result = []
+        for start in range(0, len(values), chunk_size):
+            chunk = tuple(values[start:start + chunk_size])
+            condition = '{} in ({})'.format(column, placeholders(len(chunk)))
+            if len(conditional) > 0:
+                condition += ' and {}'.format(conditional)
+            rows = self.select_conditional(table, query, condition, chunk + parameters)
+            if rows is not None:
+                result += rows
+        return result
+
+    def update_record(self, table: str, modification: str, conditional: str, parameters: tuple = ()):
         self.connect()
-        self.execute_query('update {} set {} where {}'.format(table, modification, conditional))
+        self.execute_query('update {} set {} where {}'.format(table, modification, conditional), parameters)
         self.disconnect()
@@ -0,0 +1,84 @@
+from grammar.phrases import Clause
+from controllers.ui import debug, message
+from settings import corpus_path
+
+import argparse
+import os
+import os.path as path
+import random
+from multiprocessing import Pool
+from typing import List, Tuple
+
+
+def shard_sizes(count: int, workers: int) -> List[int]:
+    """
+    :param count: The total number of sentences
+    :param workers: The number of shards to split them over
+    :return: Returns the number of sentences in each shard
+    """
+    return [count // workers + (1 if s < count % workers else 0) for s in range(workers)]
+
+
+def shard_seed(seed: int, shard: int) -> str:
+    # String seeds are hashed by random.seed, so neighbouring shards get unrelated streams
+    return '{}:{}'.format(seed, shard)
+
+
+def generate_shard(args: Tuple[int, int, int, str, int]) -> Tuple[str, int]:
+    """
+    Generates one shard of the corpus, the module level random is reseeded for the shard
+    so its output only depends on the seed and the shard number
+    :param args: A tuple of (shard number, number of sentences, seed, output directory, batch size)
+    :return: Returns the path of the shard and the number of sentences written to it
+    """
+    shard, count, seed, out_dir, batch_size = args
+    random.seed(shard_seed(seed, shard))
+
+    fpath = path.join(out_dir, 'shard-{:04d}.tsv'.format(shard))
+    written = 0
+    with open(fpath, 'w', encoding='utf8') as fp:
+        while written < count:
+            batch = Clause.generate_batch(min(batch_size, count - written))
+            for sentence, translation in batch:
+                fp.write('{}\t{}\n'.format(sentence, translation))
+            written += len(batch)
+    return fpath, written
+
+
+def generate_corpus(count: int, seed: int, workers: int,
+                    out_dir: str = corpus_path, batch_size: int = 1000) -> List[str]:
+    """
+    Generates count random clauses spread over one output file per worker,
+    the same seed and worker count always produce the same files
+    :param count: The number of sentences to generate
+    :param seed: The seed for the random streams of the shards
+    :param workers: The number of worker processes, and shards
+    :param out_dir: The directory to write the shards to
+    :param batch_size: The number of clauses each worker generates at a time
+    :return: Returns the paths of the shards
+    """
+    os.makedirs(out_dir, exist_ok=True)
+
+    tasks = [(s, c, seed, out_dir, batch_size) for s, c in enumerate(shard_sizes(count, workers))]
+    debug('Generating {} sentences over {} shards'.format(count, workers))
+
+    with Pool(workers) as pool:
+        results = pool.map(generate_shard, tasks)
+
+    for fpath, written in results:
+        debug('Wrote {} sentences to {}'.format(written, fpath))
+    message('Generated {} sentences'.format(sum(w for _, w in results)))
+    return [fpath for fpath, _ in results]
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Generates a sharded corpus of random Old English sentences')
+    parser.add_argument('count', type=int, help='The number of sentences to generate')
+    parser.add_argument('--seed', type=int, default=0, help='The seed for the random number generators')
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help='The number of worker processes')
+    parser.add_argument('--output', default=corpus_path, help='The directory to write the shards to')
+    parser.add_argument('--batch-size', type=int, default=1000,
+                        help='The number of sentences each worker generates at a time')
+    args = parser.parse_args()
+
+    generate_corpus(args.count, args.seed, args.workers, args.output, args.batch_size)
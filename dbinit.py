@@ -1,13 +1,21 @@
 from controllers.sql import SQLController
 from controllers.ui import debug, error
 from utils.grammar import case_list, plurality_list, person_list, tense, mood, \
-    long_syllable, separate_syllables, Gender, gender_list
-from settings import old_english_word_json, modern_english_word_json
+    long_syllable, separate_syllables, Gender, gender_list, feature_columns, feature_code
+from settings import old_english_word_json, modern_english_word_json, database_path
 from utils.web import use_unverified_ssl
+from utils.dump_index import build_index
+from controllers.paradigm import paradigm_tables, paradigm_features, pack_paradigm
 
+import argparse
+import hashlib
 import json
-from settings import data_path
-from typing import List, Tuple, Dict, Union
+from collections import deque
+from multiprocessing import Pool
+from settings import data_path, dump_batch_size, dump_chunk_size, dump_workers, scraper_workers
+from schemas import schemas, record_typing, staged_links
+from typing import Dict, Iterable, List, Tuple, Union
+import os
 import os.path as path
 from tqdm import tqdm
 import re
@@ -17,8 +25,46 @@ etymology_names = ['inh', 'der']
 language_codes = ['ang', 'en']
 
 
-def db_string(s: str) -> str:
-    return '"{}"'.format(s.replace('"', "'"))
+def encode_features(columns: str, rows: Iterable[tuple]) -> Iterable[tuple]:
+    """
+    :param columns: The columns of the rows, in the format of record_typing
+    :param rows: Rows holding grammatical features by name
+    :return: Returns the rows with their features swapped for the codes the tables store them as
+    """
+    coded = [(i, feature_columns[c]) for i, c in enumerate(columns[1:-1].split(', ')) if c in feature_columns]
+    if len(coded) == 0:
+        return rows
+
+    def encode(row: tuple) -> tuple:
+        row = list(row)
+        for i, feature in coded:
+            code = feature_code(feature, row[i])
+            if code is None and row[i] is not None:
+                debug('{} is not a valid {}'.format(row[i], feature.__name__.lower()))
+            row[i] = code
+        return tuple(row)
+
+    return (encode(row) for row in rows)
+
+
+def link_rows(table: str, rows: Iterable[tuple]) -> int:
+    """
+    Stages rows that refer to their root by name and lets the database swap the names for the roots' ids,
+    see SQLController.link_staged for how ambiguous names are resolved
+    :param table: The table to link the rows into, its entry in staged_links names the root column
+    :param rows: The rows in the column order of the table's entry in record_typing
+    :return: Returns the number of rows written to table
+    """
+    cont = SQLController.get_instance()
+    with cont.pooled():
+        cont.create_staging_table(table)
+        staged = cont.insert_record('staged_' + table, encode_features(record_typing[table], rows),
+                                    record_typing[table])
+        unlinked = cont.link_staged(table)
+    if unlinked > 0:
+        debug('{} rows of {} had no root word'.format(unlinked, table))
+    debug('Inserted {} of {} {} rows'.format(staged - unlinked, staged, table))
+    return staged - unlinked
 
 
 def convert_word_dictionary_noun(words: List[Dict[str, Union[List[str],
@@ -40,14 +86,13 @@ def convert_word_dictionary_noun(words: List[Dict[str, Union[List[str],
 
     for w in tqdm(words):
         for d in w['definitions']:
-            roots.append((db_string(w['word']), '"noun"', db_string(d),
+            roots.append((w['word'], 'noun', d,
                           w['word'].startswith('-') or w['word'].endswith('-')))  # Check for affix
 
         for decl in w['forms']:
             for c, d in decl.items():
                 case, plurality = c.split(' ')
-                declensions.append((db_string(d), w['word'],
-                                    db_string(plurality.lower()), db_string(case.lower())))
+                declensions.append((d, w['word'], plurality.lower(), case.lower()))
 
     return {'old_english_words': roots, 'declensions': declensions}
 
@@ -97,7 +142,7 @@ def convert_word_dictionary_verb(words: List[Tuple[str, Dict[str, Union[List[str
 
     for s, w in tqdm(words):
         for d in w['definitions']:
-            roots.append((db_string(w['word']), '"verb"', db_string(d),
+            roots.append((w['word'], 'verb', d,
                           w['word'].startswith('-') or w['word'].endswith('-')))  # Check for affix
 
         verbs.append((w['word'], False, 0, s == 'transitive'))
@@ -105,34 +150,34 @@ def convert_word_dictionary_verb(words: List[Tuple[str, Dict[str, Union[List[str
         for conj in w['forms']:
             for c, d in conj.items():
                 origin = w['word']
-                word = db_string(d)
-                person = '"none"'
-                plurality = '"none"'
-                emood = '"none"'
-                etense = '"none"'
+                word = d
+                person = 'none'
+                plurality = 'none'
+                emood = 'none'
+                etense = 'none'
                 is_participle = False
                 is_infinitive = False
 
                 tags = c.split(' ')
                 if len(tags) == 2:
                     if tags[0] == 'imperative':
-                        emood = db_string(tags[0].lower())
-                        plurality = db_string(tags[1].lower())
+                        emood = tags[0].lower()
+                        plurality = tags[1].lower()
                     elif tags[0] == 'infinitive':
                         is_infinitive = True
                         is_participle = tags[1] == 'can'
                     else:
                         is_participle = True
-                        etense = db_string(tags[0].lower())
+                        etense = tags[0].lower()
                 elif len(tags) == 3:
-                    emood = db_string(tags[0].lower())
-                    plurality = db_string(tags[1].lower())
-                    etense = db_string(tags[2].lower())
+                    emood = tags[0].lower()
+                    plurality = tags[1].lower()
+                    etense = tags[2].lower()
                 elif len(tags) == 4:
-                    emood = db_string(tags[0].lower())
-                    person = db_string(tags[1].lower())
-                    plurality = db_string(tags[2].lower())
-                    etense = db_string(tags[3].lower())
+                    emood = tags[0].lower()
+                    person = tags[1].lower()
+                    plurality = tags[2].lower()
+                    etense = tags[3].lower()
                 else:
                     debug('{} is not a valid tag name for a verb'.format(c))
 
@@ -161,7 +206,7 @@ def convert_word_dictionary_adverb(words: List[Tuple[str, Dict[str, Union[List[s
 
     for s, w in tqdm(words):
         for d in w['definitions']:
-            roots.append((db_string(w['word']), '"adverb"', db_string(d),
+            roots.append((w['word'], 'adverb', d,
                           w['word'].startswith('-') or w['word'].endswith('-')))  # Check for affix
 
         if w['word'] not in adverbs:
@@ -212,7 +257,7 @@ def convert_word_dictionary_adjectives(words: List[Dict[str, Union[List[str], Li
 
     for w in tqdm(words):
         for d in w['definitions']:
-            roots.append((db_string(w['word']), '"adjective"', db_string(d),
+            roots.append((w['word'], 'adjective', d,
                           w['word'].startswith('-') or w['word'].endswith('-')))  # Check for affix
 
         for form in w['forms']:
@@ -223,16 +268,16 @@ def convert_word_dictionary_adjectives(words: List[Dict[str, Union[List[str], Li
                 for c, f in form.items():
                     if c != 'plurality' and c != 'strength':
                         case, gender = c.split(' ')
-                        adjectives.append((w['word'], db_string(f),
+                        adjectives.append((w['word'], f,
                                            strength == 'strong',
-                                           db_string(gender), db_string(case), db_string(plurality)))
+                                           gender, case, plurality))
             else:
                 for c, f in form.items():
                     if c != 'strength':
                         plurality, case, gender = c.split(' ')
-                        adjectives.append((w['word'], db_string(f),
+                        adjectives.append((w['word'], f,
                                            strength == 'strong',
-                                           db_string(gender), db_string(case), db_string(plurality)))
+                                           gender, case, plurality))
 
     return {'old_english_words': roots, 'adjectives': adjectives}
 
@@ -245,70 +290,82 @@ conversion_dict = {
 }
 
 
-def initialize_database_scraper():
-    from soup_targets import soup_targets, wiktionary_root
-    from controllers.sql import SQLController
+def scraper_targets() -> List[Tuple[str, str, str]]:
+    """
+    :return: Returns a (part of speech, category name, category url) tuple for every category in soup_targets,
+    in the order they're scraped in
+    """
+    from soup_targets import soup_targets
+
+    targets = []
+    for t, u in soup_targets.items():
+        for s, url in u.items():
+            if isinstance(url, dict):
+                targets += [(t, s, gurl) for gurl in url.values()]
+            else:
+                targets.append((t, s, url))
+    return targets
+
+
+def scrape_category(target: Tuple[str, str, str]) -> list:
+    """
+    Scrapes a single category, the tables of the words are left as (table header, form) pairs
+    since which of them are duplicates depends on the categories scraped before it
+    :param target: A tuple from scraper_targets
+    :return: Returns the words found in the category, in the format the matching conversion function takes
+    """
+    from soup_targets import wiktionary_root
     from controllers.beautifulsoup import SoupStemScraper, SoupVerbClassScraper, \
         SoupAdverbScraper, SoupAdjectiveScraper
 
+    t, s, url = target
+    debug('Searching for {} {}'.format(s, t))
+    if t == 'nouns':
+        scraper = SoupStemScraper(wiktionary_root + '/wiki/' + url, s)
+    elif t == 'verbs':
+        scraper = SoupVerbClassScraper(wiktionary_root + '/wiki/' + url)
+    elif t == 'adverbs':
+        scraper = SoupAdverbScraper(wiktionary_root + '/wiki/' + url, s)  # There are no tables for adverbs
+    else:
+        scraper = SoupAdjectiveScraper(wiktionary_root + '/wiki/' + url, s)
+
+    scraper.defer_tables = True
+    words = scraper.find_words()
+    return [(s, w) for w in words] if t in ['verbs', 'adverbs'] else words
+
+
+def initialize_database_scraper():
+    from soup_targets import soup_targets
+    from controllers.sql import SQLController
+    from controllers.beautifulsoup import share_request_rate, unseen_forms
+
     cont = SQLController.get_instance()
-    cont.reset_database()
-    cont.setup_tables()
+    cont.reset_database(with_indices=False)
+
+    targets = scraper_targets()
+    workers = min(scraper_workers if scraper_workers is not None else os.cpu_count(), len(targets))
+    with Pool(workers, initializer=share_request_rate, initargs=(workers,)) as pool:
+        results = pool.map(scrape_category, targets, chunksize=1)
+
+    # Nouns and verbs share their table dedupe between all of their categories, so it's applied in the
+    # order of soup_targets once every category is in, which keeps the result the same as scraping them one by one
+    shared_tables = {'nouns': set(), 'verbs': set()}
+    found = {t: [] for t in soup_targets}
+    for (t, s, url), words in zip(targets, results):
+        table_set = shared_tables.get(t, set())
+        for w in words:
+            entry = w[1] if isinstance(w, tuple) else w
+            entry['forms'] = unseen_forms(entry['forms'], table_set)
+        found[t] += words
+        debug('Found {} {} in {}'.format(len(words), t, url))
 
-    noun_declension_tables = set()
-    verb_conjugation_tables = set()
     roots = []
     declensions = []
     conjugations = []
     verbs = []
     adverbs = []
     adjectives = []
-    for t, u in soup_targets.items():
-        words = []
-        debug('Searching for {}'.format(t))
-        for s, url in u.items():
-            debug('Searching for {}'.format(s))
-            if isinstance(url, dict):
-                for g, gurl in url.items():
-                    debug('Checking for {}'.format(g))
-                    scraper = None
-                    if t == 'nouns':
-                        scraper = SoupStemScraper(wiktionary_root + '/wiki/' + gurl, s,
-                                                  initial_table_set=noun_declension_tables)
-                        words += scraper.find_words()
-                        noun_declension_tables = scraper.table_set
-                    elif t == 'verbs':
-                        scraper = SoupVerbClassScraper(wiktionary_root + '/wiki/' + gurl,
-                                                       initial_table_set=verb_conjugation_tables)
-                        words += [(s, w) for w in scraper.find_words()]
-                        verb_conjugation_tables = scraper.table_set
-                    elif t == 'adverbs':
-                        scraper = SoupAdverbScraper(wiktionary_root + '/wiki/' + gurl, s)
-                        words += [(s, w) for w in scraper.find_words()]
-                    elif t == 'adjectives':
-                        scraper = SoupAdjectiveScraper(wiktionary_root + '/wiki/' + gurl, s)
-                        words += scraper.find_words()
-
-            else:
-                scraper = None
-                if t == 'nouns':
-                    scraper = SoupStemScraper(wiktionary_root + '/wiki/' + url, s,
-                                              initial_table_set=noun_declension_tables)
-                    words += scraper.find_words()
-                    noun_declension_tables = scraper.table_set
-                elif t == 'verbs':
-                    scraper = SoupVerbClassScraper(wiktionary_root + '/wiki/' + url,
-                                                   initial_table_set=verb_conjugation_tables)
-                    words += [(s, w) for w in scraper.find_words()]
-                    verb_conjugation_tables = scraper.table_set
-                elif t == 'adverbs':
-                    scraper = SoupAdverbScraper(wiktionary_root + '/wiki/' + url, s)  # There are no tables for adverbs
-                    words += [(s, w) for w in scraper.find_words()]
-                elif t == 'adjectives':
-                    scraper = SoupAdjectiveScraper(wiktionary_root + '/wiki/' + url, s)
-                    words += scraper.find_words()
-            debug('Found {} words so far'.format(len(words)))
-
+    for t, words in found.items():
         tuple_dict = conversion_dict[t](words)
         if 'old_english_words' in tuple_dict:
             roots += tuple_dict['old_english_words']
@@ -324,16 +381,218 @@ def initialize_database_scraper():
             adjectives += tuple_dict['adjectives']
 
     cont.insert_record('old_english_words', roots)
+    cont.create_indices(['old_english_words'])  # Speeds up the root lookups while linking
     insert_declensions(declensions)
     insert_verb_conjugations(conjugations)
     insert_verb_transitivities(verbs)
     insert_adverbs(adverbs)
     insert_adjectives(adjectives)
+    cont.create_indices()
+    build_paradigms()
+
+
+dump_root_columns = '(name, pos, definition, is_affix, wiktionary_entry, source)'
+dump_staged_tables = ['declensions', 'conjugations', 'ipa', 'nouns']
+
+
+def dump_columns(table: str) -> str:
+    """
+    :param table: A table written while reading the kaikki dump
+    :return: Returns the columns the rows parse_dump_line returns for table fill
+    """
+    if table == 'old_english_words':
+        return dump_root_columns
+    elif table == 'sources':
+        return '(id, hash, line)'
+    return record_typing[table[len('dump_'):]][:-1] + ', source)'
+
+
+def entry_hash(line: bytes) -> str:
+    return hashlib.sha1(line.strip()).hexdigest()
+
+
+def parse_dump_line(line: str, li: int, source: Union[int, None] = None) -> Dict[str, List[tuple]]:
+    """
+    :param line: A single entry of the kaikki dump
+    :param li: The line number of the entry in the dump
+    :param source: The id of the entry in the sources table, defaults to li
+    :return: Returns a dictionary with each key corresponding to a table and it's value a list of data to insert,
+    the rows for everything except old_english_words refer to their root by name and need to be linked,
+    every row ends with source
+    """
+    source = li if source is None else source
+    j = json.loads(line)
+
+    pos = j['pos']
+    roots = []
+    declensions = []
+    conjugations = []
+    noun_ipa = []
+    noun_germ = []
+
+    genders: List[Gender] = []
+    if 'forms' not in j:
+        # error('{} has no forms!'.format(j['word']))
+        name = [j['word']]
+    else:
+        name = [w['form'] for w in j['forms'] if 'canonical' in w['tags']]
+        for w in j['forms']:
+            if 'canonical' in w['tags']:
+                if pos == 'noun':
+                    for t in w['tags']:
+                        if t in gender_list:
+                            genders.append(Gender[t.upper()])
+            else:
+                if pos == 'noun':
+                    # Maybe a declension?
+                    cases = find_declensions(w['tags'])
+                    for c, p in cases:
+                        for n in name:
+                            declensions.append((w['form'], n, p, c, source))
+
+    for sense in j['senses']:
+        if 'form_of' in sense:
+            # Detect Declensions
+            if pos == 'noun':
+                cases = find_declensions(sense['tags'])
+                for c, p in cases:
+                    for f in sense['form_of']:
+                        for n in name:
+                            declensions.append((n, f['word'], p, c, source))
+
+            # Detect Conjugations
+            elif pos == 'verb':
+                conjs = find_verb_conjugations(sense['tags'])
+                for per, pl, t, m, part, pre in conjs:
+                    for f in sense['form_of']:
+                        for n in name:
+                            conjugations.append((n, f['word'], per, pl, m, t, part, pre, source))
+
+        definition = '. '.join(sense['glosses']) if 'glosses' in sense else ''
+        for n in name:
+            roots.append((n, pos, definition, n.startswith('-') or n.endswith('-'), li, source))
+
+    if pos == 'noun':
+        # Find IPA for manual declension
+        if 'sounds' in j:
+            found = False
+            for s in j['sounds']:
+                if 'ipa' in s:
+                    syllables = separate_syllables([s['ipa']])
+                    for n in name:
+                        noun_ipa.append((n, str(s['ipa']),
+                                         len(syllables),
+                                         bool(re.fullmatch(long_syllable, syllables[-1]) is not None), source))
+                    found = True
+            if not found:
+                debug('No ipa translation found for {}'.format(j['word']))
+        else:
+            debug('No sounds found for {}'.format(j['word']))
+
+        # Detect proto-germanic
+        if 'etymology_templates' in j:
+            for temp in j['etymology_templates']:
+                if temp['name'] == 'inh':
+                    # The word was inherited
+                    args = temp['args']
+                    if args['2'] == 'gem-pro':
+                        # And it was inherited from proto germanic
+                        proto = args['3']
+                        for n in name:
+                            for g in genders:
+                                noun_germ.append((n, proto, g.value, source))
+        else:
+            debug('{} is an OE innovation'.format(j['word']))
+
+    return {'old_english_words': roots,
+            'dump_declensions': list(encode_features(dump_columns('dump_declensions'), declensions)),
+            'dump_conjugations': list(encode_features(dump_columns('dump_conjugations'), conjugations)),
+            'dump_ipa': noun_ipa, 'dump_nouns': noun_germ}
+
+
+def dump_chunks(fpath: str, chunk_size: int = dump_chunk_size) -> List[Tuple[str, int, int, int]]:
+    """
+    Splits a JSONL file into byte ranges of about chunk_size bytes that start and end on line boundaries
+    :param fpath: The file to split
+    :param chunk_size: The approximate size of each chunk in bytes
+    :return: Returns a list of (path, start byte, end byte, line number of the first line) tuples
+    """
+    size = path.getsize(fpath)
+    boundaries = [0]
+    with open(fpath, 'rb') as fp:
+        while boundaries[-1] < size:
+            position = boundaries[-1] + chunk_size
+            if position >= size:
+                boundaries.append(size)
+            else:
+                # Reading from the byte before leaves us at the start of the line that position is in or after
+                fp.seek(position - 1)
+                fp.readline()
+                boundaries.append(fp.tell())
+
+        chunks = []
+        line = 0
+        for start, end in zip(boundaries[:-1], boundaries[1:]):
+            chunks.append((fpath, start, end, line))
+            fp.seek(start)
+            remaining = end - start
+            while remaining > 0:
+                block = fp.read(min(remaining, 1 << 20))
+                line += block.count(b'\n')
+                remaining -= len(block)
+    return chunks
+
+
+def parse_dump_chunk(chunk: Tuple[str, int, int, int]) -> Dict[str, List[tuple]]:
+    """
+    :param chunk: A (path, start byte, end byte, first line number) tuple from dump_chunks
+    :return: Returns the rows of every entry in the chunk, in the same format as parse_dump_line,
+    along with a row for each entry in sources
+    """
+    fpath, start, end, first_line = chunk
+    with open(fpath, 'rb') as fp:
+        fp.seek(start)
+        lines = fp.read(end - start).split(b'\n')
+
+    result = {'sources': []}
+    for li, line in enumerate(lines, first_line):
+        if len(line.strip()) > 0:
+            result['sources'].append((li, entry_hash(line), li))
+            for table, rows in parse_dump_line(line.decode('utf8'), li).items():
+                result.setdefault(table, []).extend(rows)
+    return result
+
+
+class RowBuffer:
+    """
+    Collects rows for several tables and writes them out in a single transaction
+    whenever more than size rows are waiting
+    """
+    def __init__(self, size: int = dump_batch_size):
+        self.size = size
+        self.rows: Dict[str, List[tuple]] = {}
+        self.count = 0
+
+    def add(self, tuple_dict: Dict[str, List[tuple]]):
+        for table, rows in tuple_dict.items():
+            self.rows.setdefault(table, []).extend(rows)
+            self.count += len(rows)
+        if self.count >= self.size:
+            self.flush()
+
+    def flush(self):
+        cont = SQLController.get_instance()
+        with cont.transaction():
+            for table, rows in self.rows.items():
+                if len(rows) > 0:
+                    cont.insert_record(table, rows, dump_columns(table))
+        self.rows = {}
+        self.count = 0
 
 
 def initialize_database_dump():
     cont = SQLController.get_instance()
-    cont.reset_database()
+    cont.reset_database(with_indices=False)
 
     # debug('Reading English Words')
     # with open(modern_english_word_json, 'rb') as fp:
@@ -353,103 +612,218 @@ def initialize_database_dump():
     #     cont.insert_record('english_words', tuples)
 
     debug('Reading Old English Words')
-    with open(old_english_word_json, 'rb') as fp:
-        lines = fp.read().decode('utf8').split('\n')
-        tuples = []
-        declensions = []
-        conjugations: List[Tuple[str, str, str, str, str, str, bool, bool]] = []
-        noun_ipa: List[Tuple[str, str, int, bool]] = []
-        noun_germ: List[Tuple[str, str, Gender]] = []
-        for li, line in enumerate(tqdm(lines[:-1])):
-            j = json.loads(line)
-
-            pos = '"{}"'.format(j['pos'].replace('"', "'"))
-
-            genders: List[Gender] = []
-            if 'forms' not in j:
-                # error('{} has no forms!'.format(j['word']))
-                name = ['"{}"'.format(j['word'].replace('"', "'"))]
-            else:
-                name = ['"{}"'.format(w['form'].replace('"', "'")) for w in j['forms'] if 'canonical' in w['tags']]
-                for w in j['forms']:
-                    if 'canonical' in w['tags']:
-                        if j['pos'] == 'noun':
-                            for t in w['tags']:
-                                if t in gender_list:
-                                    genders.append(Gender[t.upper()])
-                    else:
-                        if j['pos'] == 'noun':
-                            # Maybe a declension?
-                            cases = find_declensions(w['tags'])
-                            for c, p in cases:
-                                for n in name:
-                                    declensions.append((n, w['form'], c, p))
-
-            for sense in j['senses']:
-                conj = True
-                if 'form_of' not in sense:
-                    conj = False
-                else:
-                    # Detect Declensions
-                    if j['pos'] == 'noun':
-                        cases = find_declensions(sense['tags'])
-                        for c, p in cases:
-                            for f in sense['form_of']:
-                                # debug('{} is the {} {} form of {}'.format(name, c, p, f['word']))
-                                for n in name:
-                                    declensions.append((n, f['word'], c, p))
-
-                    # Detect Conjugations
-                    elif j['pos'] == 'verb':
-                        conjs = find_verb_conjugations(sense['tags'])
-                        for per, pl, t, m, part, pre in conjs:
-                            for f in sense['form_of']:
-                                for n in name:
-                                    conjugations.append((n, f['word'], per, pl, t, m, part, pre))
-
-                if j['pos'] == 'noun':
-                    # Find IPA for manual declension
-                    if 'sounds' in j:
-                        found = False
-                        for s in j['sounds']:
-                            if 'ipa' in s:
-                                syllables = separate_syllables([s['ipa']])
-                                for n in name:
-                                    noun_ipa.append((n, str(s['ipa']),
-                                                     len(syllables),
-                                                     bool(re.fullmatch(long_syllable, syllables[-1]) is not None)))
-                                found = True
-                        if not found:
-                            debug('No ipa translation found for {}'.format(j['word']))
-                    else:
-                        debug('No sounds found for {}'.format(j['word']))
-
-                    # Detect proto-germanic
-                    if 'etymology_templates' in j:
-                        for temp in j['etymology_templates']:
-                            if temp['name'] == 'inh':
-                                # The word was inherited
-                                args = temp['args']
-                                if args['2'] == 'gem-pro':
-                                    # And it was inherited from proto germanic
-                                    proto = args['3']
-                                    for n in name:
-                                        for g in genders:
-                                            noun_germ.append((n, proto, g))
-                    else:
-                        debug('{} is an OE innovation'.format(j['word']))
-
-                definition = '"{}"'.format(
-                    ('. '.join(sense['glosses']) if 'glosses' in sense else '').replace('"', "'"))
-                for n in name:
-                    tuples.append((n, pos, definition, li, conj))
-        cont.insert_record('old_english_words', tuples)
+    with cont.pooled():
+        rows = RowBuffer()
+        chunks = dump_chunks(old_english_word_json)
+        workers = dump_workers if dump_workers is not None else os.cpu_count()
+        with Pool(workers) as pool, tqdm(total=len(chunks)) as progress:
+            # Chunks are parsed in parallel but written in order, with a bounded number waiting to be written
+            pending = deque()
+            for chunk in chunks:
+                pending.append(pool.apply_async(parse_dump_chunk, (chunk,)))
+                if len(pending) >= 2 * workers:
+                    rows.add(pending.popleft().get())
+                    progress.update()
+            while len(pending) > 0:
+                rows.add(pending.popleft().get())
+                progress.update()
+        rows.flush()
+        cont.create_indices(['old_english_words'])
 
         # Insert Linking Tables
-        insert_declensions(declensions)
-        insert_verb_conjugations(conjugations)
-        insert_ipa(noun_ipa)
-        insert_proto(noun_germ)
+        for table in dump_staged_tables:
+            debug('Linking {}'.format(table))
+            unlinked = cont.link_staged(table, 'dump_' + table)
+            if unlinked > 0:
+                debug('{} rows of {} had no root word'.format(unlinked, table))
+        cont.create_indices()
+    build_paradigms()
+    build_index(old_english_word_json)
+
+
+def build_paradigms(origins: Union[List[int], None] = None):
+    """
+    Packs the forms of every noun, verb, and adjective root into its row of the paradigms table,
+    roots without any forms get a row as well, with every cell marked as missing
+    :param origins: If given, only the paradigms of these root ids are rebuilt, ids that are no longer roots are
+    dropped from the table
+    """
+    cont = SQLController.get_instance()
+    with cont.transaction():
+        scope = ''
+        if origins is not None:
+            cont.conn.execute('create temp table paradigm_origins (id integer primary key)')
+            cont.conn.executemany('insert or ignore into paradigm_origins values (?)', [(i,) for i in origins])
+            scope = ' and {} in (select id from paradigm_origins)'
+
+        cont.conn.execute('delete from paradigms where 1' + scope.format('origin'))
+        for pos, table in paradigm_tables.items():
+            debug('Building the {} paradigms'.format(pos))
+            forms = {}
+            for origin, *row in cont.select_conditional(table, 'origin, word, ' + ', '.join(paradigm_features[pos]),
+                                                        'origin is not null{} order by id'.format(
+                                                            scope.format('origin'))):
+                forms.setdefault(origin, []).append(row)
+            # Forms can be linked to a root of another part of speech when theirs couldn't be found
+            roots = [i for i, in cont.select_conditional('old_english_words', 'id', 'pos = ?' + scope.format('id'),
+                                                         (pos,))]
+            roots += sorted(set(forms.keys()).difference(roots))
+            cont.insert_record('paradigms', ((i, pos) + pack_paradigm(pos, forms.get(i, [])) for i in roots))
+
+        if origins is not None:
+            cont.conn.execute('drop table paradigm_origins')
+
+
+def schema_columns(schema: str) -> List[str]:
+    """
+    :return: Returns the definitions of the columns in a table's schema, without its key constraints
+    """
+    body = schema[schema.index('(') + 1:schema.rindex(')')]
+    return [d.strip() for d in body.strip().split(',\n')
+            if not d.strip().startswith(('primary key', 'foreign key'))]
+
+
+def migrate_database() -> bool:
+    """
+    Brings a database made by an older version up to the current schemas, the tables and columns added since are
+    created, and the tables made when the grammatical features were stored by name are rewritten so that they hold
+    the codes utils.grammar.feature_code gives them, tables that already do are left alone
+    :return: Returns True if anything had to be changed
+    """
+    cont = SQLController.get_instance()
+    tables = {schema[:schema.index(' ')]: schema for schema in schemas}
+    existing = {t for t, in cont.select_conditional('sqlite_master', 'name', "type = 'table'")}
+    created = set(tables.keys()).difference(existing)
+    if len(created) > 0:
+        debug('Creating the tables {}'.format(', '.join(sorted(created))))
+        cont.setup_tables(with_indices=False)
+
+    added = False
+    migrated = False
+    with cont.pooled():
+        cont.conn.create_function('feature_code', 2,
+                                  lambda feature, name: feature_code(feature_columns[feature], name),
+                                  deterministic=True)
+        for table, schema in tables.items():
+            info = cont.execute_read_query('pragma table_info({})'.format(table))
+            present = {c for _, c, _, _, _, _ in info}
+            for definition in schema_columns(schema):
+                if definition.split(' ')[0] not in present:
+                    debug('Adding {} to {}'.format(definition, table))
+                    with cont.transaction():
+                        cont.conn.execute('alter table {} add column {}'.format(table, definition))
+                    added = True
+
+            named = [c for _, c, t, _, _, _ in info if c in feature_columns and t.lower() == 'text']
+            if len(named) == 0:
+                continue
+
+            debug('Migrating the features of {}'.format(table))
+            columns = [c for _, c, _, _, _, _ in cont.execute_read_query('pragma table_info({})'.format(table))]
+            selection = ', '.join(["feature_code('{0}', {0})".format(c) if c in named else c for c in columns])
+            # Run on the connection directly so that a failed copy raises and rolls back before anything is dropped
+            with cont.transaction():
+                cont.conn.execute('alter table {0} rename to {0}_named'.format(table))
+                cont.conn.execute('create table {}'.format(schema))
+                cont.conn.execute('insert into {0} ({1}) select {2} from {0}_named'.format(
+                    table, ', '.join(columns), selection))
+                cont.conn.execute('drop table {}_named'.format(table))
+            migrated = True
+
+    if len(created) == 0 and not added and not migrated:
+        return False
+    cont.create_indices()
+    if migrated or 'paradigms' in created:
+        build_paradigms()
+    return True
+
+
+def update_database_dump(fpath: str = old_english_word_json):
+    """
+    Brings a database built by initialize_database_dump up to date with the dump, only the entries whose lines were
+    added, removed or edited since are parsed, and only the rows referring to a root name one of them uses are relinked
+    :param fpath: The kaikki dump
+    """
+    cont = SQLController.get_instance()
+    if path.exists(database_path):
+        migrate_database()
+    sources = cont.select('sources', 'id, hash, line') if path.exists(database_path) else None
+    if not sources:
+        debug('There is no previous build to compare the dump with, rebuilding the database')
+        initialize_database_dump()
+        return
+
+    # hash -> [(id, line)] with the last line first, lines that are still in the dump are taken off as they're found
+    existing: Dict[str, List[Tuple[int, int]]] = {}
+    for sid, h, li in sorted(sources, key=lambda e: e[2], reverse=True):
+        existing.setdefault(h, []).append((sid, li))
+    next_id = max(sid for sid, _, _ in sources) + 1
+
+    debug('Comparing the dump with the database')
+    added: List[Tuple[int, bytes]] = []
+    moved: List[Tuple[int, int]] = []
+    with open(fpath, 'rb') as fp:
+        for li, line in enumerate(fp):
+            if len(line.strip()) > 0:
+                matches = existing.get(entry_hash(line))
+                if matches:
+                    sid, previous = matches.pop()
+                    if previous != li:
+                        moved.append((li, sid))
+                else:
+                    added.append((li, line))
+    removed = [(sid,) for matches in existing.values() for sid, _ in matches]
+
+    debug('{} entries were added, {} removed and {} moved'.format(len(added), len(removed), len(moved)))
+    if len(added) == 0 and len(removed) == 0 and len(moved) == 0:
+        return
+
+    with cont.pooled(), cont.transaction():
+        def mark_affected(condition: str, parameters: tuple = ()):
+            cont.execute_query('insert or ignore into affected_names select name from old_english_words '
+                               'where {}'.format(condition), parameters)
+            for t in dump_staged_tables:
+                cont.execute_query('insert or ignore into affected_names select {} from dump_{} '
+                                   'where {}'.format(staged_links[t][0], t, condition), parameters)
+
+        cont.execute_query('create temp table affected_names (name text primary key)')
+        cont.execute_query('create temp table removed_sources (id integer primary key)')
+        cont.insert_record('removed_sources', removed, '(id)')
+        mark_affected('source in (select id from removed_sources)')
+
+        parsed = {'sources': []}
+        for sid, (li, line) in enumerate(added, next_id):
+            parsed['sources'].append((sid, entry_hash(line), li))
+            for table, rows in parse_dump_line(line.decode('utf8'), li, sid).items():
+                parsed.setdefault(table, []).extend(rows)
+        for table, rows in parsed.items():
+            cont.insert_record(table, rows, dump_columns(table))
+        mark_affected('source >= ?', (next_id,))
+
+        # Every root an affected name had or now has, their paradigms are rebuilt once the forms are relinked
+        touched = [i for i, in cont.select_conditional('old_english_words', 'id',
+                                                      'name in (select name from affected_names)')]
+
+        # The preferred root of an affected name may have changed, so all of its links are rebuilt
+        for table in dump_staged_tables:
+            cont.delete_record(table, '{} in (select id from old_english_words where name in '
+                                      '(select name from affected_names))'.format(staged_links[table][0]))
+        for table in ['old_english_words'] + ['dump_' + t for t in dump_staged_tables]:
+            cont.delete_record(table, 'source in (select id from removed_sources)')
+        cont.delete_record('sources', 'id in (select id from removed_sources)')
+
+        cont.execute_many('update sources set line = ? where id = ?', moved)
+        cont.execute_many('update old_english_words set wiktionary_entry = ? where source = ?', moved)
+
+        for table in dump_staged_tables:
+            unlinked = cont.link_staged(table, 'dump_' + table, 'affected_names')
+            if unlinked > 0:
+                debug('{} rows of {} had no root word'.format(unlinked, table))
+
+        cont.execute_query('drop table affected_names')
+        cont.execute_query('drop table removed_sources')
+    build_paradigms(touched)
+    build_index(fpath)
 
 
 def find_declensions(sense: List[str]) -> List[Tuple[str, str]]:
@@ -503,250 +877,59 @@ def find_verb_conjugations(sense: List[str]) -> List[Tuple[str, str, str, str, b
 
 
 def insert_declensions(declensions: List[Tuple[str, str, str, str]]):
-    cont = SQLController.get_instance()
-
     debug('Inserting Noun Declension Table')
-    if len(declensions) > 0:
-        # words = list(set(['"{}"'.format(d[1].replace('"', "'")) for d in declensions] + [d[0] for d in declensions]))
-        words = list(set(['"{}"'.format(d[1].replace('"', "'")) for d in declensions]))  # for scraper style
-        where_clause = 'name in ({})'.format(','.join(words)) if len(words) > 1 else 'name = {}'.format(words[0])
-        indices = cont.select_conditional('old_english_words', 'id, name, pos', where_clause)
-
-        debug('Generating foreign key dictionary')
-        pos_dict = {}
-        index_dict = {}
-        for index, name, pos in indices:
-            if name not in index_dict:
-                index_dict[name] = index
-                pos_dict[name] = pos
-            elif pos == 'noun' and pos_dict[name] != 'noun':
-                index_dict[name] = index
-                pos_dict[name] = pos
-            elif pos == 'noun':
-                debug('Possible ambiguous declension of {} as a {} and {}'.format(name, pos, pos_dict[name]))
-
-        debug('linking...')
-        tuples = []
-        # for o, w, c, p in declensions:
-        for w, o, p, c in declensions:  # for scraper style
-            # if w in index_dict:
-            #     # orig = o[1:-1]
-            #     orig = o  # for scraper style
-            #     if orig in index_dict:
-            #         tuples.append((w, index_dict[orig], db_string(p), db_string(c)))
-            #     else:
-            #         debug('{} was not found to be a root word'.format(o))
-            # else:
-            #     debug('{} was not found to be a root word'.format(w))
-
-            # For scraper style
-            orig = o  # for scraper style
-            if orig in index_dict:
-                tuples.append((w, index_dict[orig], p, c))
-            else:
-                debug('{} was not found to be a root word'.format(o))
-
-        cont.insert_record('declensions', tuples)
+    link_rows('declensions', declensions)
 
 
 def insert_ipa(declensions: List[Tuple[str, str, int, bool]]):
-    cont = SQLController.get_instance()
-
     debug('Inserting Noun IPA Table')
-    words = list(set([d[0] for d in declensions]))
-    where_clause = 'name in ({})'.format(','.join(words)) if len(words) > 1 else 'name = {}'.format(words[0])
-    indices = cont.select_conditional('old_english_words', 'id, name, pos', where_clause)
-
-    debug('Generating foreign key dictionary')
-    pos_dict = {}
-    index_dict = {}
-    for index, name, pos in indices:
-        if name not in index_dict:
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'noun' and pos_dict[name] != 'noun':
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'noun':
-            debug('Possible ambiguous pos of {} as a {} and {}'.format(name, pos, pos_dict[name]))
-
-    debug('linking...')
-    tuples = []
-    for w, t, c, p in declensions:
-        w = w[1:-1]
-        if w in index_dict:
-            tuples.append(('"{}"'.format(index_dict[w]), '"{}"'.format(t.replace('"', "'")), c, 1 if p else 0))
-        else:
-            debug('{} was not found to be a root word'.format(w))
-
-    cont.insert_record('ipa', tuples)
+    link_rows('ipa', ((w, t, c, 1 if p else 0) for w, t, c, p in declensions))
 
 
 def insert_proto(declensions: List[Tuple[str, str, Gender]]):
-    cont = SQLController.get_instance()
-
     debug('Inserting Noun Proto Germanic Table')
-    words = list(set([d[0] for d in declensions]))
-    where_clause = 'name in ({})'.format(','.join(words)) if len(words) > 1 else 'name = {}'.format(words[0])
-    indices = cont.select_conditional('old_english_words', 'id, name, pos', where_clause)
-
-    debug('Generating foreign key dictionary')
-    pos_dict = {}
-    index_dict = {}
-    for index, name, pos in indices:
-        if name not in index_dict:
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'noun' and pos_dict[name] != 'noun':
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'noun':
-            debug('Possible ambiguous pos of {} as a {} and {}'.format(name, pos, pos_dict[name]))
-
-    debug('linking...')
-    tuples = []
-    for w, t, g in declensions:
-        w = w[1:-1]
-        if w in index_dict:
-            tuples.append(('"{}"'.format(index_dict[w]),
-                           '"{}"'.format(t.replace('"', "'")),
-                           '"{}"'.format(g.name.lower())))
-        else:
-            debug('{} was not found to be a root word'.format(w))
-
-    cont.insert_record('nouns', tuples)
+    link_rows('nouns', ((w, t, g.value) for w, t, g in declensions))
 
 
 def insert_verb_conjugations(conjugations: List[Tuple[str, str, str, str, str, str, bool, bool]]):
-    cont = SQLController.get_instance()
-
     debug('Inserting Verb Conjugation Table')
-    words = list(set([db_string(d[1]) for d in conjugations]))
-    where_clause = 'name in ({})'.format(','.join(words)) if len(words) > 1 else 'name = {}'.format(words[0])
-    indices = cont.select_conditional('old_english_words', 'id, name, pos', where_clause)
-
-    debug('Generating foreign key dictionary')
-    pos_dict = {}
-    index_dict = {}
-    for index, name, pos in indices:
-        if name not in index_dict:
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'verb' and pos_dict[name] != 'verb':
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'verb':
-            debug('Possible ambiguous conjugation of {} as a {} and {}'.format(name, pos, pos_dict[name]))
-
-    debug('linking...')
-    tuples = []
-    for w, o, per, pl, t, m, pt, pr in conjugations:
-        if o in index_dict:
-            tuples.append((w, index_dict[o],
-                           per, pl, t, m,
-                           1 if pt else 0, 1 if pr else 0))
-        else:
-            debug('{} was not found to be a root verb'.format(o))
-
-    cont.insert_record('conjugations', tuples)
+    link_rows('conjugations', ((w, o, per, pl, t, m, 1 if pt else 0, 1 if pr else 0)
+                               for w, o, per, pl, t, m, pt, pr in conjugations))
 
 
 def insert_verb_transitivities(conjugations: List[Tuple[str, bool, int, bool]]):
-    cont = SQLController.get_instance()
-
-    debug('Inserting Verb Conjugation Table')
-    words = list(set([db_string(d[0]) for d in conjugations]))
-    where_clause = 'name in ({})'.format(','.join(words)) if len(words) > 1 else 'name = {}'.format(words[0])
-    indices = cont.select_conditional('old_english_words', 'id, name, pos', where_clause)
-
-    debug('Generating foreign key dictionary')
-    pos_dict = {}
-    index_dict = {}
-    for index, name, pos in indices:
-        if name not in index_dict:
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'verb' and pos_dict[name] != 'verb':
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'verb':
-            debug('Possible ambiguous conjugation of {} as a {} and {}'.format(name, pos, pos_dict[name]))
-
-    debug('linking...')
-    tuples = []
-    for w, stren, cl, trans in conjugations:
-        if w in index_dict:
-            tuples.append((index_dict[w], 1 if stren else 0, cl, 1 if trans else 0))
-        else:
-            debug('{} was not found to be a root verb'.format(w))
-
-    cont.insert_record('verbs', tuples)
+    debug('Inserting Verb Transitivity Table')
+    link_rows('verbs', ((w, 1 if stren else 0, cl, 1 if trans else 0) for w, stren, cl, trans in conjugations))
 
 
 def insert_adverbs(adverbs: List[Tuple[str, bool, bool]]):
-    cont = SQLController.get_instance()
-
     debug('Inserting Adverb Table')
-    words = list(set([db_string(d[0]) for d in adverbs]))
-    where_clause = 'name in ({})'.format(','.join(words)) if len(words) > 1 else 'name = {}'.format(words[0])
-    indices = cont.select_conditional('old_english_words', 'id, name, pos', where_clause)
-
-    debug('Generating foreign key dictionary')
-    pos_dict = {}
-    index_dict = {}
-    for index, name, pos in indices:
-        if name not in index_dict:
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'adverb' and pos_dict[name] != 'adverb':
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'adverb':
-            debug('Possible ambiguous conjugation of {} as a {} and {}'.format(name, pos, pos_dict[name]))
-
-    debug('linking...')
-    tuples = []
-    for w, comp, sup in adverbs:
-        if w in index_dict:
-            tuples.append((index_dict[w], 1 if comp else 0, 1 if sup else 0))
-        else:
-            debug('{} was not found to be a root adverb'.format(w))
-
-    cont.insert_record('adverbs', tuples)
+    link_rows('adverbs', ((w, 1 if comp else 0, 1 if sup else 0) for w, comp, sup in adverbs))
 
 
-def insert_adjectives(adverbs: List[Tuple[str, str, bool, str, str, str]]):
-    cont = SQLController.get_instance()
-
+def insert_adjectives(adjectives: List[Tuple[str, str, bool, str, str, str]]):
     debug('Inserting Adjective Declension Table')
-    words = list(set([db_string(d[0]) for d in adverbs]))
-    where_clause = 'name in ({})'.format(','.join(words)) if len(words) > 1 else 'name = {}'.format(words[0])
-    indices = cont.select_conditional('old_english_words', 'id, name, pos', where_clause)
-
-    debug('Generating foreign key dictionary')
-    pos_dict = {}
-    index_dict = {}
-    for index, name, pos in indices:
-        if name not in index_dict:
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'adjective' and pos_dict[name] != 'adjective':
-            index_dict[name] = index
-            pos_dict[name] = pos
-        elif pos == 'adjective':
-            debug('Possible ambiguous conjugation of {} as a {} and {}'.format(name, pos, pos_dict[name]))
-
-    debug('linking...')
-    tuples = []
-    for w, o, stren, gen, case, plur in adverbs:
-        if w in index_dict:
-            tuples.append((index_dict[w], o, 1 if stren else 0, gen, case, plur))
-        else:
-            debug('{} was not found to be a root adverb'.format(w))
-
-    cont.insert_record('adjectives', tuples)
+    link_rows('adjectives', ((w, o, 1 if stren else 0, gen, case, plur)
+                             for w, o, stren, gen, case, plur in adjectives))
 
 
 if __name__ == '__main__':
-    use_unverified_ssl()
-    initialize_database_scraper()
+    parser = argparse.ArgumentParser(description='Builds the word database')
+    parser.add_argument('--dump', action='store_true',
+                        help='Build the database from the kaikki dump instead of scraping wiktionary')
+    parser.add_argument('--update', action='store_true',
+                        help='Only apply the entries of the kaikki dump that changed since the database was built')
+    parser.add_argument('--migrate', action='store_true',
+                        help='Convert an existing database to the current schema instead of building a new one')
+    args = parser.parse_args()
+
+    if args.migrate:
+        if not migrate_database():
+            debug('The database is already up to date')
+    elif args.update:
+        update_database_dump()
+    elif args.dump:
+        initialize_database_dump()
+    else:
+        use_unverified_ssl()
+        initialize_database_scraper()
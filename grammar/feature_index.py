@@ -0,0 +1,104 @@
+from controllers.sql import SQLController
+from controllers.paradigm import Paradigms, paradigm_tables, paradigm_features, cell_positions, cell_key
+from controllers.ui import debug
+from grammar.restrictions import WordRestriction
+
+from typing import Dict, Iterable, List, Tuple
+
+
+# The tables holding features of a part of speech's roots that aren't part of its forms, and their root column
+root_feature_tables = {
+    'verb': ('verbs', 'word', ['transitivity'])
+}
+
+
+def bitset(positions: Iterable[int], size: int) -> int:
+    bits = bytearray((size + 7) // 8)
+    for p in positions:
+        bits[p >> 3] |= 1 << (p & 7)
+    return int.from_bytes(bits, 'little')
+
+
+def set_bits(bits: int) -> List[int]:
+    """
+    :return: Returns the positions of the bits that are set, in ascending order
+    """
+    return [i for i, b in enumerate(reversed(bin(bits)[2:])) if b == '1']
+
+
+class FeatureIndex:
+    """
+    Bitsets over the roots that have forms for a part of speech, one for each cell of its paradigm
+    and one for each value of the features that belong to the root instead of a form,
+    bit i of every bitset stands for roots[i]
+    """
+    def __init__(self, pos: str):
+        cont = SQLController.get_instance()
+        self.pos = pos
+        table = paradigm_tables[pos]
+        features = paradigm_features[pos]
+
+        debug('Indexing the features of the {} forms'.format(pos))
+        rows = cont.select_conditional(table, 'origin, ' + ', '.join(features), 'origin is not null')
+        # (id, name) of every root with a form, in id order
+        self.roots: List[Tuple[int, str]] = cont.select_conditional(
+            'old_english_words', 'id, name', 'id in (select origin from {}) order by id'.format(table))
+        position = {r: i for i, (r, _) in enumerate(self.roots)}
+
+        cells: Dict[int, List[int]] = {}
+        for origin, *row in rows:
+            cell = cell_positions[pos].get(cell_key(pos, tuple(row)))
+            if cell is not None and origin in position:
+                cells.setdefault(cell, []).append(position[origin])
+        # cell position -> roots with a form in it
+        self.cells: Dict[int, int] = {c: bitset(p, len(self.roots)) for c, p in cells.items()}
+
+        # (column, value) -> roots with that value
+        self.values: Dict[Tuple[str, int], int] = {}
+        # The roots that can be drawn at all, the restrictions are checked against the root table joined on the forms
+        self.listed = (1 << len(self.roots)) - 1
+        if pos in root_feature_tables:
+            root_table, root_column, columns = root_feature_tables[pos]
+            values: Dict[Tuple[str, int], List[int]] = {}
+            listed = []
+            for root, *row in cont.select(root_table, ', '.join([root_column] + columns)):
+                if root in position:
+                    listed.append(position[root])
+                    for column, value in zip(columns, row):
+                        values.setdefault((column, value), []).append(position[root])
+            self.values = {k: bitset(p, len(self.roots)) for k, p in values.items()}
+            self.listed = bitset(listed, len(self.roots))
+
+    def supports(self, restrictions: List[WordRestriction]) -> bool:
+        """
+        :return: Returns True if every restriction is on a feature the index has bitsets for
+        """
+        columns = set(paradigm_features[self.pos]).union(c for c, _ in self.values.keys())
+        for r in restrictions:
+            feature = r.feature()
+            if feature is None or feature[0] not in columns:
+                return False
+        return True
+
+    def eligible(self, restrictions: List[WordRestriction]) -> List[Tuple[int, str]]:
+        """
+        :param restrictions: Restrictions that the index supports
+        :return: Returns the (id, name) of every root that has a form satisfying all of the restrictions
+        that are on its forms at once, and that satisfies the rest, in id order
+        """
+        fixed = {}
+        bits = self.listed
+        for r in restrictions:
+            column, value = r.feature()
+            if column in paradigm_features[self.pos]:
+                if fixed.get(column, value) != value:
+                    return []
+                fixed[column] = value
+            else:
+                bits &= self.values.get((column, value), 0)
+
+        forms = 0
+        for cell in Paradigms.expand(self.pos, tuple(fixed.get(f) for f in paradigm_features[self.pos])):
+            if cell in cell_positions[self.pos]:
+                forms |= self.cells.get(cell_positions[self.pos][cell], 0)
+        return [self.roots[i] for i in set_bits(bits & forms)]
@@ -1,9 +1,26 @@
 from grammar.pos import Noun, Verb
 from utils.grammar import WordOrder, Case, Plurality, Person, Tense, Mood
 from grammar.restrictions import TransitivityRestriction
+from controllers.lexicon import Lexicon
+from controllers.sql import SQLController
 
 import random as rng
-from typing import List, Union
+from typing import List, Tuple, Union
+
+
+def render_batch(items: list) -> List[Tuple[str, str]]:
+    """
+    Renders phrases or clauses, loading every word they use up front with one query per table
+    instead of querying for each word as it's rendered
+    :param items: The phrases or clauses to render
+    :return: Returns a list of (rendered text, meaning) pairs
+    """
+    lex = Lexicon.active()
+    if lex is None:
+        lex = Lexicon.for_words([w for item in items for w in item.words()])
+
+    with Lexicon.scope(lex):
+        return [(repr(item), item.meaning()) for item in items]
 
 
 class Phrase:
@@ -11,9 +28,21 @@ class Phrase:
     def generate_random():
         pass
 
+    @classmethod
+    def generate_batch(cls, n: int) -> List[Tuple[str, str]]:
+        """
+        :param n: The number of phrases to generate
+        :return: Returns n random phrases as (rendered text, meaning) pairs
+        """
+        with SQLController.get_instance().pinned_version():
+            return render_batch([cls.generate_random() for _ in range(n)])
+
     def meaning(self) -> str:
         pass
 
+    def words(self) -> list:
+        pass
+
 
 class NounPhrase(Phrase):
     def __init__(self, n: Noun):
@@ -25,6 +54,9 @@ class NounPhrase(Phrase):
     def meaning(self):
         return rng.choice(self.noun.meaning)[0]
 
+    def words(self) -> list:
+        return [self.noun]
+
     @staticmethod
     def generate_random():
         return NounPhrase(Noun.get_random_word())
@@ -40,6 +72,9 @@ class VerbPhrase(Phrase):
     def meaning(self):
         return rng.choice(self.verb.meaning)[0]
 
+    def words(self) -> list:
+        return [self.verb]
+
     @staticmethod
     def generate_random():
         return VerbPhrase(Verb.get_random_word())
@@ -58,6 +93,9 @@ class TransitiveVerbPhrase(VerbPhrase):
         chunks.append(repr(self.do))
         return ' '.join(chunks)
 
+    def words(self) -> list:
+        return super().words() + self.do.words() + (self.io.words() if self.io is not None else [])
+
     @staticmethod
     def generate_random():
         direct_object = NounPhrase.generate_random()
@@ -103,6 +141,12 @@ class Clause:
     def translation(self) -> str:
         return ', '.join([p.meaning() for p in self.get_word_order()]) + '({})'.format(self.word_order)
 
+    def meaning(self) -> str:
+        return self.translation()
+
+    def words(self) -> list:
+        return self.subject.words() + self.verb.words() + self.object.words()
+
     @staticmethod
     def generate_random():
         sub = NounPhrase.generate_random()
@@ -123,3 +167,12 @@ class Clause:
         obj.noun.plurality = Plurality(rng.randint(0, 1))
 
         return Clause(sub, verb, obj)
+
+    @staticmethod
+    def generate_batch(n: int) -> List[Tuple[str, str]]:
+        """
+        :param n: The number of clauses to generate
+        :return: Returns n random clauses as (sentence, translation) pairs
+        """
+        with SQLController.get_instance().pinned_version():
+            return render_batch([Clause.generate_random() for _ in range(n)])
@@ -1,23 +1,70 @@
-from controllers.sql import SQLController
+from controllers.sql import SQLController, placeholders
+from controllers.lexicon import Lexicon
+from controllers.paradigm import Paradigms, form_order
 from utils.grammar import Case, Plurality, Mood, Tense, Person, Gender
 from controllers.ui import debug
 from grammar.restrictions import WordRestriction
+from grammar.sampler import WordSampler, RootIds
 
+from functools import wraps
 from typing import List, Tuple, Union
-import random as rng
+
+
+def cached(attribute: str):
+    """
+    Stores what the decorated method returns on the word in attribute,
+    POS.__setattr__ resets it when the root or one of the word's inflections is changed
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(self):
+            if getattr(self, attribute) is None:
+                object.__setattr__(self, attribute, method(self))
+            return getattr(self, attribute)
+        return wrapper
+    return decorator
 
 
 class POS:
-    def __init__(self, root: str, pos: str):
+    """
+    Base of the word classes, the root's ids, meanings, and possible forms are looked up once per word,
+    and the inflected form is kept until one of the attributes in inflections changes,
+    the words are slotted since generating a corpus can keep millions of them alive
+    """
+    __slots__ = ('root', '_index', '_meaning', '_possible', '_form')
+    pos = None
+    inflections = ()
+
+    def __init__(self, root: str, index: Union[RootIds, None] = None):
+        """
+        :param root: The name of the root
+        :param index: The ids of the root if they're already known, otherwise they're looked up by name
+        """
         self.root = root
-        self.pos = pos
+        if index is not None:
+            object.__setattr__(self, '_index', index)
+
+    def __setattr__(self, name, value):
+        if name == 'root':
+            object.__setattr__(self, '_index', None)
+            object.__setattr__(self, '_meaning', None)
+            object.__setattr__(self, '_possible', None)
+            object.__setattr__(self, '_form', None)
+        elif name in self.inflections:
+            object.__setattr__(self, '_form', None)
+        object.__setattr__(self, name, value)
 
     @property
-    def index(self) -> List[int]:
+    @cached('_index')
+    def index(self) -> RootIds:
         cont = SQLController.get_instance()
+        lex = Lexicon.active()
 
-        indices = cont.select_conditional('old_english_words', 'id',
-                                          'name = "{}" and pos = "{}"'.format(self.root, self.pos))
+        if lex is not None:
+            indices = lex.indices(self.root, self.pos)
+        else:
+            indices = cont.select_conditional('old_english_words', 'id',
+                                              'name = ? and pos = ?', (self.root, self.pos))
 
         if len(indices) > 1:
             debug('Multiple indices found for root {} with indices {} and {}'.format(self.root,
@@ -26,66 +73,62 @@ class POS:
                   )
         elif len(indices) == 0:
             debug('No index found for {}'.format(self.root))
-            return [-1]
+            return -1,
 
-        return [index[0] for index in indices]
+        return tuple(index[0] for index in indices)
 
     @property
+    @cached('_meaning')
     def meaning(self) -> List[str]:
         cont = SQLController.get_instance()
+        lex = Lexicon.active()
+        index = self.index
+        if lex is not None:
+            return lex.meanings(index)
         definitions = cont.select_conditional('old_english_words', 'definition',
-                                              'id in ({})'.format(str(self.index)[1:-1]))
+                                              'id in ({})'.format(placeholders(len(index))), tuple(index))
         return definitions
 
 
-class Noun:
-    def __init__(self, root: str):
-        self.root = root
+class Noun(POS):
+    __slots__ = ('case', 'plurality')
+    pos = 'noun'
+    inflections = __slots__
+
+    def __init__(self, root: str, index: Union[RootIds, None] = None):
+        super().__init__(root, index)
         self.case: Case = Case.ROOT
         self.plurality: Plurality = Plurality.NONE
 
     def __repr__(self) -> str:
         return '{} {} {}'.format(self.root, self.case.name.lower(), self.plurality.name.lower())
 
-    @property
-    def index(self) -> List[int]:
-        cont = SQLController.get_instance()
-
-        indices = cont.select_conditional('old_english_words', 'id',
-                                          'name = "{}" and pos = "noun"'.format(self.root))
-
-        if len(indices) > 1:
-            debug('Multiple indices found for root {} with indices {} and {}'.format(self.root,
-                                                                                     indices[0][0],
-                                                                                     indices[1][0])
-                  )
-        elif len(indices) == 0:
-            debug('No index found for {}'.format(self.root))
-            return [-1]
-
-        return [index[0] for index in indices]
-
-    @property
-    def meaning(self) -> List[str]:
-        cont = SQLController.get_instance()
-        definitions = cont.select_conditional('old_english_words', 'definition',
-                                              'id in ({})'.format(str(self.index)[1:-1]))
-        return definitions
-
+    @cached('_form')
     def get_declension(self) -> str:
         cont = SQLController.get_instance()
+        lex = Lexicon.active()
 
         if self.case == Case.ROOT:
             return self.root
         else:
-            declensions = cont.select_conditional('declensions', 'word',
-                                                  'origin in ({}) and noun_case = "{}"{}'.format(
-                                                      str(self.index)[1:-1],
-                                                      self.case.name.lower(),
-                                                      ' and plurality = "{}"'.format(
-                                                        self.plurality.name.lower())
-                                                      if self.plurality != Plurality.NONE else
-                                                      ''))
+            index = self.index
+            plurality = self.plurality.value if self.plurality != Plurality.NONE else None
+
+            if lex is not None:
+                declensions = lex.declension(index, self.case.value, plurality)
+            else:
+                declensions = Paradigms.get_instance().forms('noun', index, (self.case.value, plurality))
+
+            if declensions is None:
+                # The paradigms haven't been built yet
+                condition = 'origin in ({}) and noun_case = ?'.format(placeholders(len(index)))
+                parameters = tuple(index) + (self.case.value,)
+                if plurality is not None:
+                    condition += ' and plurality = ?'
+                    parameters += (plurality,)
+
+                declensions = cont.select_conditional('declensions', 'word',
+                                                      condition + ' order by ' + form_order('noun'), parameters)
 
             if len(declensions) > 1:
                 debug('Multiple declensions for {} in {} {} '
@@ -103,29 +146,32 @@ class Noun:
 
             return dec_index[0]
 
+    @cached('_possible')
     def get_possible_declensions(self) -> List[Tuple[Case, Plurality]]:
         cont = SQLController.get_instance()
-        declensions = cont.select_conditional('declensions', 'plurality, noun_case', 'origin in ({})'.format(
-            str(self.index)[1:-1]))
-        return [(Case.ROOT, Plurality.NONE)] + [(Case[c.upper()], Plurality[p.upper()]) for p, c in declensions]
+        lex = Lexicon.active()
+        index = self.index
+        if lex is not None:
+            declensions = lex.possible_declensions(index)
+        else:
+            declensions = cont.select_conditional('declensions', 'plurality, noun_case',
+                                                  'origin in ({})'.format(placeholders(len(index))), tuple(index))
+        return [(Case.ROOT, Plurality.NONE)] + [(Case(c), Plurality(p)) for p, c in declensions
+                                                if None not in (p, c)]
 
     @staticmethod
     def get_random_word(restrictions: Union[List[WordRestriction], None] = None):
-        cont = SQLController.get_instance()
-        if restrictions is not None and len(restrictions) > 0:
-            constraint_string = (' and '.join([r.get_sql_constraint() for r in restrictions])
-                                 if restrictions is not None else '')
-            possible_words = cont.select_conditional('declensions', 'distinct origin', constraint_string)
-            word = rng.choice(possible_words)[0]
-            return Noun(cont.select_conditional('old_english_words', 'name', 'id = {}'.format(word))[0][0])
-        else:
-            possible_words = cont.select_conditional('old_english_words', 'name', 'pos = "noun" and is_affix = 0')
-        return Noun(rng.choice(possible_words)[0])
+        ids, root = WordSampler.get_instance().draw('noun', restrictions)
+        return Noun(root, ids)
 
 
-class Verb:
-    def __init__(self, root: str):
-        self.root = root
+class Verb(POS):
+    __slots__ = ('plurality', 'mood', 'person', 'tense', 'is_infinitive', 'is_participle')
+    pos = 'verb'
+    inflections = __slots__
+
+    def __init__(self, root: str, index: Union[RootIds, None] = None):
+        super().__init__(root, index)
         self.plurality: Plurality = Plurality.NONE
         self.mood: Mood = Mood.ROOT
         self.person: Person = Person.NONE
@@ -145,49 +191,45 @@ class Verb:
         else:
             return '{} {} {} {} {}'.format(self.root, self.mood, self.person, self.plurality, self.tense)
 
-    @property
-    def index(self) -> List[int]:
-        cont = SQLController.get_instance()
-
-        indices = cont.select_conditional('old_english_words', 'id',
-                                          'name = "{}" and pos = "verb"'.format(self.root))
-
-        if len(indices) > 1:
-            debug('Multiple indices found for root {} with indices {} and {}'.format(self.root,
-                                                                                     indices[0][0],
-                                                                                     indices[1][0])
-                  )
-        elif len(indices) == 0:
-            debug('No index found for {}'.format(self.root))
-            return [-1]
-
-        return [index[0] for index in indices]
-
-    @property
-    def meaning(self) -> List[str]:
-        cont = SQLController.get_instance()
-        definitions = cont.select_conditional('old_english_words', 'definition',
-                                              'id in ({})'.format(str(self.index)[1:-1]))
-        return definitions
-
+    @cached('_form')
     def get_conjugation(self) -> str:
         cont = SQLController.get_instance()
+        lex = Lexicon.active()
 
         if self.mood == Mood.ROOT:
             return self.root
         else:
-            condition = 'mood = "{}" and participle = {} and is_infinitive = {}'.format(self.mood.name.lower(),
-                                                                                        1 if self.is_participle else 0,
-                                                                                        1 if self.is_infinitive else 0)
-            if self.plurality != Plurality.NONE:
-                condition += ' and plurality = "{}"'.format(self.plurality.name.lower())
-            if self.person != Person.NONE:
-                condition += ' and person = "{}"'.format(self.person.name.lower())
-            if self.tense != Tense.NONE:
-                condition += ' and tense = "{}"'.format(self.tense.name.lower())
-
-            conjugations = cont.select_conditional('conjugations', 'word',
-                                                   'origin in ({}) and '.format(str(self.index)[1:-1]) + condition)
+            index = self.index
+            participle = 1 if self.is_participle else 0
+            infinitive = 1 if self.is_infinitive else 0
+            plurality = self.plurality.value if self.plurality != Plurality.NONE else None
+            person = self.person.value if self.person != Person.NONE else None
+            tense = self.tense.value if self.tense != Tense.NONE else None
+
+            if lex is not None:
+                conjugations = lex.conjugation(index, self.mood.value, participle, infinitive,
+                                               plurality, person, tense)
+            else:
+                conjugations = Paradigms.get_instance().forms('verb', index, (self.mood.value, tense, person, plurality,
+                                                                              participle, infinitive))
+
+            if conjugations is None:
+                # The paradigms haven't been built yet
+                condition = 'origin in ({}) and mood = ? and participle = ? and is_infinitive = ?'.format(
+                    placeholders(len(index)))
+                parameters = tuple(index) + (self.mood.value, participle, infinitive)
+                if plurality is not None:
+                    condition += ' and plurality = ?'
+                    parameters += (plurality,)
+                if person is not None:
+                    condition += ' and person = ?'
+                    parameters += (person,)
+                if tense is not None:
+                    condition += ' and tense = ?'
+                    parameters += (tense,)
+
+                conjugations = cont.select_conditional('conjugations', 'word',
+                                                       condition + ' order by ' + form_order('verb'), parameters)
 
             if len(conjugations) > 1:
                 debug('Multiple conjugations for {} in {} {} '
@@ -205,70 +247,47 @@ class Verb:
 
             return dec_index[0]
 
+    @cached('_possible')
     def get_possible_conjugations(self) -> List[Tuple[Plurality, Tense, Mood, Person, bool, bool]]:
         cont = SQLController.get_instance()
-        conjugations = cont.select_conditional('conjugations',
-                                               'plurality, tense, mood, person, participle, is_infinitive',
-                                               'origin in ({})'.format(str(self.index)[1:-1]))
+        lex = Lexicon.active()
+        index = self.index
+        if lex is not None:
+            conjugations = lex.possible_conjugations(index)
+        else:
+            conjugations = cont.select_conditional('conjugations',
+                                                   'plurality, tense, mood, person, participle, is_infinitive',
+                                                   'origin in ({})'.format(placeholders(len(index))), tuple(index))
         return [(Plurality.NONE, Tense.NONE, Mood.NONE, Person.NONE, False, False)] + \
-               [(Plurality[p.upper().strip()], Tense[t.upper()], Mood[m.upper()],
-                 Person[per.upper()], par, inf)
-                for p, t, m, per, par, inf in conjugations]
+               [(Plurality(p), Tense(t), Mood(m), Person(per), par, inf)
+                for p, t, m, per, par, inf in conjugations if None not in (p, t, m, per)]
 
     @staticmethod
     def get_random_word(restrictions: Union[List[WordRestriction], None] = None):
-        cont = SQLController.get_instance()
-        if restrictions is not None and len(restrictions) > 0:
-            constraint_string = (' and '.join([r.get_sql_constraint() for r in restrictions])
-                                 if restrictions is not None else '')
-            possible_words = cont.select_conditional('conjugations join verbs on verbs.word = conjugations.origin',
-                                                     'distinct origin', constraint_string)
-            word = rng.choice(possible_words)[0]
-            return Verb(cont.select_conditional('old_english_words', 'name', 'id = {}'.format(word))[0][0])
-        else:
-            possible_words = cont.select_conditional('old_english_words', 'name', 'pos = "verb" and is_affix = 0')
-        return Verb(rng.choice(possible_words)[0])
+        ids, root = WordSampler.get_instance().draw('verb', restrictions)
+        return Verb(root, ids)
 
 
-class Adverb:
-    def __init__(self, a: str):
-        self.root = a
-
-    @property
-    def index(self) -> List[int]:
-        cont = SQLController.get_instance()
+class Adverb(POS):
+    __slots__ = ()
+    pos = 'adverb'
 
-        indices = cont.select_conditional('old_english_words', 'id',
-                                          'name = "{}" and pos = "noun"'.format(self.root))
-
-        if len(indices) > 1:
-            debug('Multiple indices found for root {} with indices {} and {}'.format(self.root,
-                                                                                     indices[0][0],
-                                                                                     indices[1][0])
-                  )
-        elif len(indices) == 0:
-            debug('No index found for {}'.format(self.root))
-            return [-1]
-
-        return [index[0] for index in indices]
-
-    @property
-    def meaning(self) -> List[str]:
-        cont = SQLController.get_instance()
-        definitions = cont.select_conditional('old_english_words', 'definition',
-                                              'id in ({})'.format(str(self.index)[1:-1]))
-        return definitions
+    def __init__(self, a: str, index: Union[RootIds, None] = None):
+        super().__init__(a, index)
 
     @staticmethod
     def get_random_word():
-        cont = SQLController.get_instance()
-        possible_words = cont.select_conditional('old_english_words', 'name', 'pos = "adverb" and is_affix = 0')
-        return Adverb(rng.choice(possible_words)[0])
+        ids, root = WordSampler.get_instance().draw('adverb')
+        return Adverb(root, ids)
 
 
-class Adjective:
-    def __init__(self, root: str):
-        self.root = root
+class Adjective(POS):
+    __slots__ = ('case', 'plurality', 'gender', 'strength')
+    pos = 'adjective'
+    inflections = __slots__
+
+    def __init__(self, root: str, index: Union[RootIds, None] = None):
+        super().__init__(root, index)
         self.case: Case = Case.ROOT
         self.plurality: Plurality = Plurality.NONE
         self.gender: Gender = Gender.NONE
@@ -277,48 +296,39 @@ class Adjective:
     def __repr__(self) -> str:
         return '{}'.format(self.root)
 
-    @property
-    def index(self) -> List[int]:
-        cont = SQLController.get_instance()
-
-        indices = cont.select_conditional('old_english_words', 'id',
-                                          'name = "{}" and pos = "adjective"'.format(self.root))
-
-        if len(indices) > 1:
-            debug('Multiple indices found for root {} with indices {} and {}'.format(self.root,
-                                                                                     indices[0][0],
-                                                                                     indices[1][0])
-                  )
-        elif len(indices) == 0:
-            debug('No index found for {}'.format(self.root))
-            return [-1]
-
-        return [index[0] for index in indices]
-
-    @property
-    def meaning(self) -> List[str]:
-        cont = SQLController.get_instance()
-        definitions = cont.select_conditional('old_english_words', 'definition',
-                                              'id in ({})'.format(str(self.index)[1:-1]))
-        return definitions
-
+    @cached('_form')
     def get_declension(self) -> str:
         cont = SQLController.get_instance()
+        lex = Lexicon.active()
 
         if self.case == Case.ROOT:
             return self.root
         else:
-            condition = 'strength = {} and noun_case = "{}"'.format(1 if self.strength else 0, self.case.name.lower())
-
-            if self.plurality != Plurality.NONE:
-                condition += ' and plurality = "{}"'.format(self.plurality.name.lower())
-            if self.gender != Gender.NONE:
-                condition += ' and gender = "{}"'.format(self.gender.name.lower())
-
-            declensions = cont.select_conditional('adjectives', 'word',
-                                                  'origin in ({}) and {}'.format(
-                                                      str(self.index)[1:-1],
-                                                      condition))
+            index = self.index
+            strength = 1 if self.strength else 0
+            plurality = self.plurality.value if self.plurality != Plurality.NONE else None
+            gender = self.gender.value if self.gender != Gender.NONE else None
+
+            if lex is not None:
+                declensions = lex.adjective_declension(index, strength, self.case.value, plurality, gender)
+            else:
+                declensions = Paradigms.get_instance().forms('adjective', index,
+                                                             (strength, self.case.value, plurality, gender))
+
+            if declensions is None:
+                # The paradigms haven't been built yet
+                condition = 'origin in ({}) and strength = ? and noun_case = ?'.format(placeholders(len(index)))
+                parameters = tuple(index) + (strength, self.case.value)
+
+                if plurality is not None:
+                    condition += ' and plurality = ?'
+                    parameters += (plurality,)
+                if gender is not None:
+                    condition += ' and gender = ?'
+                    parameters += (gender,)
+
+                declensions = cont.select_conditional('adjectives', 'word',
+                                                      condition + ' order by ' + form_order('adjective'), parameters)
 
             if len(declensions) > 1:
                 debug('Multiple declensions for {} in {} {} '
@@ -336,25 +346,21 @@ class Adjective:
 
             return dec_index[0]
 
+    @cached('_possible')
     def get_possible_declensions(self) -> List[Tuple[bool, Gender, Case, Plurality]]:
         cont = SQLController.get_instance()
-        declensions = cont.select_conditional('adjectives',
-                                              'strength, gender, plurality, noun_case', 'origin in ({})'.format(
-                str(self.index)[1:-1]))
+        lex = Lexicon.active()
+        index = self.index
+        if lex is not None:
+            declensions = lex.possible_adjective_declensions(index)
+        else:
+            declensions = cont.select_conditional('adjectives', 'strength, gender, plurality, noun_case',
+                                                  'origin in ({})'.format(placeholders(len(index))), tuple(index))
 
         return [(False, Gender.NONE, Case.ROOT, Plurality.NONE)] + \
-               [(s == 1, Gender[g.upper()], Case[c.upper()], Plurality[p.upper()]) for s, g, p, c in declensions]
+               [(s == 1, Gender(g), Case(c), Plurality(p)) for s, g, p, c in declensions if None not in (g, p, c)]
 
     @staticmethod
     def get_random_word(restrictions: Union[List[WordRestriction], None] = None):
-        cont = SQLController.get_instance()
-        if restrictions is not None and len(restrictions) > 0:
-            constraint_string = (' and '.join([r.get_sql_constraint() for r in restrictions])
-                                 if restrictions is not None else '')
-            possible_words = cont.select_conditional('adjectives', 'distinct origin', constraint_string)
-            word = rng.choice(possible_words)[0]
-            return Noun(cont.select_conditional('old_english_words', 'name', 'id = {}'.format(word))[0][0])
-        else:
-            possible_words = cont.select_conditional('old_english_words', 'name', 'pos = "adjective" and is_affix = 0')
-
-        return Adjective(rng.choice(possible_words)[0])
+        ids, root = WordSampler.get_instance().draw('adjective', restrictions)
+        return Adjective(root, ids)
@@ -1,17 +1,40 @@
 from utils.grammar import Case, Plurality
 
+from typing import Tuple, Union
+
 
 class WordRestriction:
     def get_sql_constraint(self) -> str:
         pass
 
+    def feature(self) -> Union[Tuple[str, int], None]:
+        """
+        :return: Returns the (column, value) the restriction requires, or None if it can only be checked in sql
+        """
+        return None
+
+    def get_sql_parameters(self) -> tuple:
+        return ()
+
+    def key(self) -> tuple:
+        """
+        :return: Returns a hashable value that is equal for restrictions that select the same words
+        """
+        return (type(self).__name__,) + self.get_sql_parameters()
+
 
 class CaseRestriction(WordRestriction):
     def __init__(self, c: Case):
         self._c = c
 
     def get_sql_constraint(self) -> str:
-        return 'declension = "{}"'.format(self._c.name.lower())
+        return 'noun_case = ?'
+
+    def feature(self) -> Tuple[str, int]:
+        return 'noun_case', self._c.value
+
+    def get_sql_parameters(self) -> tuple:
+        return self._c.value,
 
 
 class PluralityRestriction(WordRestriction):
@@ -19,7 +42,13 @@ class PluralityRestriction(WordRestriction):
         self._c = c
 
     def get_sql_constraint(self) -> str:
-        return 'declension = "{}"'.format(self._c.name.lower())
+        return 'plurality = ?'
+
+    def feature(self) -> Tuple[str, int]:
+        return 'plurality', self._c.value
+
+    def get_sql_parameters(self) -> tuple:
+        return self._c.value,
 
 
 class TransitivityRestriction(WordRestriction):
@@ -27,4 +56,10 @@ class TransitivityRestriction(WordRestriction):
         self._t = t
 
     def get_sql_constraint(self) -> str:
-        return 'transitivity = {}'.format(1 if self._t else 0)
+        return 'transitivity = ?'
+
+    def feature(self) -> Tuple[str, int]:
+        return 'transitivity', 1 if self._t else 0
+
+    def get_sql_parameters(self) -> tuple:
+        return 1 if self._t else 0,
@@ -0,0 +1,126 @@
+from controllers.sql import SQLController
+from controllers.lexicon import Lexicon
+from controllers.ui import debug
+from grammar.restrictions import WordRestriction
+from grammar.feature_index import FeatureIndex
+
+from typing import Dict, List, Tuple, Union
+import random as rng
+
+
+# The ids of every old_english_words row of a root, shared by all the words drawn for it
+RootIds = Tuple[int, ...]
+
+# The table each part of speech's restrictions are evaluated against
+restriction_tables = {
+    'noun': 'declensions',
+    'verb': 'conjugations join verbs on verbs.word = conjugations.origin',
+    'adjective': 'adjectives'
+}
+
+
+class WordSampler:
+    """
+    Caches the candidate roots for each part of speech and restriction set,
+    so that drawing a random word doesn't need to query the whole vocabulary every time,
+    roots are drawn along with their ids so the words never have to look them up by name.
+    Restrictions on features are resolved with a FeatureIndex, any others are run as sql
+    """
+    instance = None
+
+    def __init__(self):
+        self.pools: Dict[tuple, List[Tuple[RootIds, str]]] = {}
+        # pos -> name -> ids
+        self.ids: Dict[str, Dict[str, RootIds]] = {}
+        self.features: Dict[str, FeatureIndex] = {}
+        self.data_version = None
+
+    @staticmethod
+    def get_instance():
+        if WordSampler.instance is None:
+            WordSampler.instance = WordSampler()
+        return WordSampler.instance
+
+    def invalidate(self):
+        self.pools = {}
+        self.ids = {}
+        self.features = {}
+
+    def _check_version(self):
+        version = SQLController.get_instance().data_version
+        Lexicon.check_version(version)
+        if version != self.data_version:
+            if self.data_version is not None:
+                debug('Database changed, dropping cached word pools')
+            self.invalidate()
+            self.data_version = version
+
+    def pool(self, pos: str, restrictions: Union[List[WordRestriction], None] = None) -> List[Tuple[RootIds, str]]:
+        """
+        :param pos: The part of speech of the roots
+        :param restrictions: The restrictions the roots have to satisfy
+        :return: Returns the ids and name of every root that can be drawn, one entry per matching root id
+        """
+        self._check_version()
+        restrictions = restrictions if restrictions is not None else []
+        key = (pos,) + tuple(sorted(r.key() for r in restrictions))
+
+        if key not in self.pools:
+            ids = self.root_ids(pos)
+            # Forms can be linked to a root of another part of speech, which is drawn with just its own id
+            self.pools[key] = [(ids[name] if index in ids.get(name, ()) else (index,), name)
+                               for index, name in self.build_pool(pos, restrictions)]
+        return self.pools[key]
+
+    def root_ids(self, pos: str) -> Dict[str, RootIds]:
+        """
+        :param pos: The part of speech of the roots
+        :return: Returns the ids of every root of pos by name, the same ids the word's index property would find
+        """
+        if pos not in self.ids:
+            lex = Lexicon.active()
+            if lex is not None and lex.complete:
+                self.ids[pos] = {name: tuple(ids) for (name, p), ids in lex.names.items() if p == pos}
+            else:
+                ids = {}
+                for index, name in SQLController.get_instance().select_conditional('old_english_words', 'id, name',
+                                                                                   'pos = ? order by id', (pos,)):
+                    ids.setdefault(name, []).append(index)
+                self.ids[pos] = {name: tuple(i) for name, i in ids.items()}
+        return self.ids[pos]
+
+    def feature_index(self, pos: str) -> FeatureIndex:
+        if pos not in self.features:
+            self.features[pos] = FeatureIndex(pos)
+        return self.features[pos]
+
+    def build_pool(self, pos: str, restrictions: List[WordRestriction]) -> List[Tuple[int, str]]:
+        """
+        :return: Returns the (id, name) of every root that satisfies the restrictions, in id order
+        """
+        cont = SQLController.get_instance()
+        lex = Lexicon.active()
+
+        if len(restrictions) == 0:
+            if lex is not None and lex.complete:
+                return lex.roots.get(pos, [])
+            return cont.select_conditional('old_english_words', 'id, name',
+                                           'pos = ? and is_affix = 0 order by id', (pos,))
+
+        if pos in restriction_tables:
+            index = self.feature_index(pos)
+            if index.supports(restrictions):
+                return index.eligible(restrictions)
+
+        constraint_string = ' and '.join([r.get_sql_constraint() for r in restrictions])
+        parameters = tuple(p for r in restrictions for p in r.get_sql_parameters())
+        return cont.select_conditional('old_english_words', 'id, name',
+                                       'id in (select origin from {} where {}) order by id'.format(
+                                           restriction_tables[pos], constraint_string),
+                                       parameters)
+
+    def draw(self, pos: str, restrictions: Union[List[WordRestriction], None] = None) -> Tuple[RootIds, str]:
+        """
+        :return: Returns the ids and name of a random root
+        """
+        return rng.choice(self.pool(pos, restrictions))
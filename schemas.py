@@ -3,18 +3,22 @@ id integer primary key,
 name text not null,
 pos text not null,
 definition text not null,
-is_affix bool not null
+is_affix bool not null,
+wiktionary_entry integer,
+source integer
 );
 '''
 
+# The grammatical features of the forms (see utils.grammar.feature_columns) are stored as the value of their enum
+# member, NULL marks a tag that isn't one of the members
 conjugations_schemas = '''conjugations (
 id integer primary key,
 word text not null,
 origin integer not null,
-person text,
-plurality text,
-mood text,
-tense text,
+person integer,
+plurality integer,
+mood integer,
+tense integer,
 participle bool not null,
 is_infinitive bool not null,
 foreign key (origin) references old_english_words(id)
@@ -25,8 +29,8 @@ declensions_schemas = '''declensions (
 id integer primary key,
 word text not null,
 origin integer not null,
-plurality text,
-noun_case text not null,
+plurality integer,
+noun_case integer,
 foreign key (origin) references old_english_words(id)
 );
 '''
@@ -45,9 +49,9 @@ id integer primary key,
 origin integer not null,
 word text not null,
 strength bool not null,
-gender text not null,
-noun_case text not null,
-plurality text not null,
+gender integer,
+noun_case integer,
+plurality integer,
 foreign key (origin) references old_english_words(id)
 );'''
 
@@ -59,6 +63,81 @@ superlative bool not null,
 foreign key (word) references old_english_words(id)
 );'''
 
+ipa_schemas = '''ipa (
+id integer primary key,
+word integer not null,
+ipa text not null,
+syllables integer not null,
+long_syllable bool not null,
+foreign key (word) references old_english_words(id)
+);'''
+
+noun_schemas = '''nouns (
+id integer primary key,
+word integer not null,
+proto text not null,
+gender integer,
+foreign key (word) references old_english_words(id)
+);'''
+
+
+# The whole paradigm of each noun, verb, and adjective root in one row, see controllers/paradigm.py for the layout,
+# built from the form tables by dbinit.build_paradigms
+paradigm_schemas = '''paradigms (
+origin integer not null,
+pos text not null,
+forms text not null,
+cells blob not null,
+primary key (origin, pos),
+foreign key (origin) references old_english_words(id)
+);'''
+
+
+# Every entry of the kaikki dump the database was built from, by the hash of its line,
+# the rows derived from an entry carry its id in their source column
+sources_schemas = '''sources (
+id integer primary key,
+hash text not null,
+line integer not null
+);'''
+
+# The rows of the dump entries as they were parsed, with their roots referred to by name,
+# kept so the linked tables can be rebuilt for just the names an update touched
+dump_declensions_schemas = '''dump_declensions (
+word text not null,
+origin text not null,
+plurality integer,
+noun_case integer,
+source integer not null
+);'''
+
+dump_conjugations_schemas = '''dump_conjugations (
+word text not null,
+origin text not null,
+person integer,
+plurality integer,
+mood integer,
+tense integer,
+participle bool not null,
+is_infinitive bool not null,
+source integer not null
+);'''
+
+dump_ipa_schemas = '''dump_ipa (
+word text not null,
+ipa text not null,
+syllables integer not null,
+long_syllable bool not null,
+source integer not null
+);'''
+
+dump_noun_schemas = '''dump_nouns (
+word text not null,
+proto text not null,
+gender integer,
+source integer not null
+);'''
+
 
 schemas = [
     old_english_schemas,
@@ -66,7 +145,15 @@ schemas = [
     declensions_schemas,
     verb_schemas,
     adjective_schemas,
-    adverb_schemas
+    adverb_schemas,
+    ipa_schemas,
+    noun_schemas,
+    paradigm_schemas,
+    sources_schemas,
+    dump_declensions_schemas,
+    dump_conjugations_schemas,
+    dump_ipa_schemas,
+    dump_noun_schemas
 ]
 
 triggers = [
@@ -75,11 +162,50 @@ triggers = [
 views = [
 ]
 
+# Created by SQLController.setup_tables, or separately with SQLController.create_indices after a bulk load
+indices = [
+    'old_english_words_name_pos on old_english_words (name, pos)',
+    'old_english_words_pos on old_english_words (pos, is_affix)',
+    'declensions_origin on declensions (origin, noun_case, plurality)',
+    'declensions_case on declensions (noun_case, plurality, origin)',
+    'conjugations_origin on conjugations (origin, mood, tense, person)',
+    'verbs_word on verbs (word, transitivity)',
+    'adjectives_origin on adjectives (origin)',
+    'adverbs_word on adverbs (word)',
+    'ipa_word on ipa (word)',
+    'nouns_word on nouns (word)',
+    'old_english_words_source on old_english_words (source)',
+    'sources_hash on sources (hash)',
+    'dump_declensions_source on dump_declensions (source)',
+    'dump_declensions_origin on dump_declensions (origin)',
+    'dump_conjugations_source on dump_conjugations (source)',
+    'dump_conjugations_origin on dump_conjugations (origin)',
+    'dump_ipa_source on dump_ipa (source)',
+    'dump_ipa_word on dump_ipa (word)',
+    'dump_nouns_source on dump_nouns (source)',
+    'dump_nouns_word on dump_nouns (word)'
+]
+
 record_typing = {
     'old_english_words': '(name, pos, definition, is_affix)',
     'conjugations': '(word, origin, person, plurality, mood, tense, participle, is_infinitive)',
     'declensions': '(word, origin, plurality, noun_case)',
     'verbs': '(word, strength, verb_class, transitivity)',
     'adjectives': '(origin, word, strength, gender, noun_case, plurality)',
-    'adverbs': '(word, comparative, superlative)'
+    'adverbs': '(word, comparative, superlative)',
+    'ipa': '(word, ipa, syllables, long_syllable)',
+    'nouns': '(word, proto, gender)',
+    'paradigms': '(origin, pos, forms, cells)'
+}
+
+# Rows that refer to their root by name are staged in temporary copies of their tables during a bulk load,
+# the name column is swapped for the root's id when they are linked into the real table
+staged_links = {
+    'declensions': ('origin', 'noun'),
+    'conjugations': ('origin', 'verb'),
+    'verbs': ('word', 'verb'),
+    'adjectives': ('origin', 'adjective'),
+    'adverbs': ('word', 'adverb'),
+    'ipa': ('word', 'noun'),
+    'nouns': ('word', 'noun')
 }
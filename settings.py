@@ -8,9 +8,30 @@ database_path = path.join(main_home, 'words.db')
 model_path = path.join(main_home, 'models')
 data_path = path.join(main_home, 'data')
 html_cache_path = path.join(data_path, 'html')
+html_cache_db = path.join(data_path, 'html_cache.db')
 old_english_word_json = path.join(data_path, 'kaikki.org-dictionary-OldEnglish.json')
 modern_english_word_json = path.join(data_path, 'kaikki.org-dictionary-English.json')
+corpus_path = path.join(data_path, 'corpus')
 
 # Web Settings
 cache_html = True
 offline_mode = False
+html_cache_compression = 6  # The zlib level pages are stored in the html cache with
+html_cache_max_age = None  # The seconds a cached page is trusted before it is revalidated, None never revalidates
+fetch_workers = 8  # The number of word pages downloaded at the same time while scraping
+requests_per_second = 5  # The most requests sent to wiktionary each second, 0 disables the limit
+html_parser = 'html.parser'  # The BeautifulSoup tree builder used by the scrapers, 'lxml' is faster if installed
+slice_word_pages = True  # Only build the tree for the Old English section of each word page
+cache_parsed_pages = True  # Keep what was parsed out of each word page so unchanged pages aren't parsed again
+scraper_workers = None  # The number of categories scraped at the same time, None uses every core
+listing_prefetch = 4  # The number of category listing pages read ahead of the words being scraped
+
+# Database Settings
+persistent_connections = True
+connection_pool_size = 4  # The idle connections kept for reuse once the threads that used them exit
+statement_cache_size = 256
+insert_chunk_size = 10000  # The number of rows written per executemany call by insert_record
+use_lexicon = False  # Resolve words from an in-memory snapshot of the database instead of querying it
+dump_batch_size = 50000  # The number of rows buffered before they are written while reading the kaikki dump
+dump_chunk_size = 1 << 22  # The size in bytes of the pieces of the dump that are parsed in parallel
+dump_workers = None  # The number of processes parsing the dump, None uses every core
@@ -0,0 +1,115 @@
+import os
+import tempfile
+import unittest
+
+import dbinit
+from controllers.lexicon import Lexicon
+from controllers.sql import SQLController
+from grammar.phrases import NounPhrase, VerbPhrase, render_batch
+from grammar.pos import Noun, Verb
+from utils.grammar import Case, Mood, Person, Plurality, Tense
+
+
+class DatabaseTest(unittest.TestCase):
+    """
+    Runs each test against a fresh database in a temporary directory
+    """
+    def setUp(self):
+        self.cwd = os.getcwd()
+        self.directory = tempfile.TemporaryDirectory()
+        os.chdir(self.directory.name)  # database_path is relative to the working directory
+        SQLController.reset_database()
+
+    def tearDown(self):
+        SQLController.delete_db()
+        os.chdir(self.cwd)
+        self.directory.cleanup()
+
+    @staticmethod
+    def add_root(name: str, pos: str, definition: str) -> int:
+        cont = SQLController.get_instance()
+        cont.insert_record('old_english_words', [(name, pos, definition, 0)])
+        return cont.select_conditional('old_english_words', 'max(id)', '1')[0][0]
+
+
+class SharedRootTest(DatabaseTest):
+    """
+    A root whose forms were linked to the root of another part of speech with the same name is drawn with that
+    root's id, the scoped lexicon of a batch has to load it by id to render it
+    """
+    def setUp(self):
+        super().setUp()
+        self.noun_id = self.add_root('stān', 'noun', 'stone')
+        SQLController.get_instance().insert_record('conjugations', [
+            ('stānaþ', self.noun_id, Person.THIRD.value, Plurality.SINGULAR.value,
+             Mood.INDICATIVE.value, Tense.PRESENT.value, 0, 0)])
+
+    def verb(self) -> Verb:
+        v = Verb('stān', (self.noun_id,))
+        v.mood, v.person, v.plurality, v.tense = Mood.INDICATIVE, Person.THIRD, Plurality.SINGULAR, Tense.PRESENT
+        return v
+
+    def test_for_words_loads_by_id(self):
+        lex = Lexicon.for_words([self.verb()])
+        self.assertEqual(lex.meanings([self.noun_id]), [('stone',)])
+
+    def test_render_batch_matches_single_render(self):
+        phrase = VerbPhrase(self.verb())
+        self.assertEqual(render_batch([VerbPhrase(self.verb())]), [(repr(phrase), phrase.meaning())])
+        self.assertEqual(repr(phrase), 'stānaþ')
+
+
+class UnsetFeatureTest(DatabaseTest):
+    """
+    A lookup that leaves a feature unset matches several forms, the form tables, the paradigms, and the lexicon
+    have to agree on which of them comes first
+    """
+    def setUp(self):
+        super().setUp()
+        cont = SQLController.get_instance()
+        noun_id = self.add_root('stān', 'noun', 'stone')
+        verb_id = self.add_root('singan', 'verb', 'to sing')
+        # Inserted against the order of their cells so that the row order doesn't decide
+        cont.insert_record('declensions', [('stānas', noun_id, Plurality.PLURAL.value, Case.NOMINATIVE.value),
+                                           ('stān', noun_id, Plurality.SINGULAR.value, Case.NOMINATIVE.value)])
+        cont.insert_record('conjugations', [
+            ('singþ', verb_id, Person.THIRD.value, Plurality.SINGULAR.value,
+             Mood.INDICATIVE.value, Tense.PRESENT.value, 0, 0),
+            ('sungon', verb_id, None, Plurality.PLURAL.value, Mood.INDICATIVE.value, Tense.PAST.value, 0, 0)])
+
+    @staticmethod
+    def words() -> list:
+        n = Noun('stān')
+        n.case = Case.NOMINATIVE
+        v = Verb('singan')
+        v.mood = Mood.INDICATIVE
+        return [n, v]
+
+    @staticmethod
+    def render(words: list) -> list:
+        return [words[0].get_declension(), words[1].get_conjugation()]
+
+    def test_paths_agree(self):
+        expected = ['stān', 'sungon']
+        self.assertEqual(self.render(self.words()), expected)  # The paradigms haven't been built, so this is sql
+
+        dbinit.build_paradigms()
+        self.assertEqual(self.render(self.words()), expected)
+
+        for lex in [Lexicon(), Lexicon.for_words(self.words())]:
+            with Lexicon.scope(lex):
+                self.assertEqual(self.render(self.words()), expected)
+
+    def test_render_batch_matches_single_render(self):
+        dbinit.build_paradigms()
+        noun, verb = self.words()
+        phrases = [NounPhrase(noun), VerbPhrase(verb)]
+        single = [(repr(p), p.meaning()) for p in phrases]
+
+        noun, verb = self.words()
+        self.assertEqual(render_batch([NounPhrase(noun), VerbPhrase(verb)]), single)
+        self.assertEqual([s for s, _ in single], ['stān', 'sungon'])
+
+
+if __name__ == '__main__':
+    unittest.main()
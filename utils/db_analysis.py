@@ -1,22 +1,19 @@
-import json
 from controllers.sql import SQLController
 from typing import List, Dict
 from controllers.ui import debug, error
 from settings import old_english_word_json
+from utils.dump_index import DumpReader
 
 
 def load_words_and_objects(selection_criteria: str) -> List[dict]:
     cont = SQLController.get_instance()
 
-    debug('Loading wiktionary lines')
-    with open(old_english_word_json, mode='rb') as fp:
-        wiktionary_lines = fp.read().decode('utf8').splitlines(keepends=False)
-
     debug('Extracting database selection')
     selection = cont.select_conditional('old_english_words', 'name, wiktionary_entry', selection_criteria)
 
     debug('Loading json objects')
-    objects = [json.loads(wiktionary_lines[line]) for _, line in selection]
+    with DumpReader(old_english_word_json) as reader:
+        objects = [reader.entry(line) for _, line in selection]
 
     debug('Words Loaded Successfully')
     return objects
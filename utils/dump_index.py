@@ -0,0 +1,89 @@
+import json
+import mmap
+import os
+from array import array
+
+from controllers.ui import debug
+
+
+def index_path(fpath: str) -> str:
+    return fpath + '.idx'
+
+
+def build_index(fpath: str) -> array:
+    """
+    Finds where every line of a JSONL file starts and saves it next to the file,
+    lines are split on newlines only, the same way the dump is numbered when it's read into the database
+    :param fpath: The file to index
+    :return: Returns the index, the size and modification time of the file followed by the offset of each line
+    """
+    debug('Indexing {}'.format(fpath))
+    stat = os.stat(fpath)
+    index = array('q', [stat.st_size, stat.st_mtime_ns])
+
+    if stat.st_size > 0:
+        with open(fpath, 'rb') as fp, mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) as m:
+            start = 0
+            while start < stat.st_size:
+                index.append(start)
+                end = m.find(b'\n', start)
+                if end < 0:
+                    break
+                start = end + 1
+
+    with open(index_path(fpath), 'wb') as fp:
+        index.tofile(fp)
+    return index
+
+
+def load_index(fpath: str) -> array:
+    """
+    :param fpath: An indexed file
+    :return: Returns the index of the file, it's rebuilt if it's missing or the file changed since it was made
+    """
+    stat = os.stat(fpath)
+    ipath = index_path(fpath)
+    if os.path.exists(ipath):
+        index = array('q')
+        with open(ipath, 'rb') as fp:
+            index.frombytes(fp.read())
+        if len(index) >= 2 and index[0] == stat.st_size and index[1] == stat.st_mtime_ns:
+            return index
+    return build_index(fpath)
+
+
+class DumpReader:
+    """
+    Reads single entries of a JSONL file by their line number, through a memory map of the file and its index
+    """
+    def __init__(self, fpath: str):
+        self.index = load_index(fpath)
+        self.size = self.index[0]
+        self.fp = open(fpath, 'rb')
+        self.map = mmap.mmap(self.fp.fileno(), 0, access=mmap.ACCESS_READ) if self.size > 0 else b''
+
+    def __len__(self) -> int:
+        return len(self.index) - 2
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+    def line(self, li: int) -> bytes:
+        """
+        :param li: The line number
+        :return: Returns the line without its newline
+        """
+        start = self.index[li + 2]
+        end = self.index[li + 3] - 1 if li + 3 < len(self.index) else self.size
+        return self.map[start:end].rstrip(b'\r\n')
+
+    def entry(self, li: int) -> dict:
+        return json.loads(self.line(li).decode('utf8'))
+
+    def close(self):
+        if isinstance(self.map, mmap.mmap):
+            self.map.close()
+        self.fp.close()
@@ -1,4 +1,4 @@
-from typing import List
+from typing import Dict, List, Type, Union
 import enum
 import re
 
@@ -95,3 +95,31 @@ class WordOrder(enum.Enum):
     VSO = 3
     VOS = 4
     OVS = 5
+
+
+# The columns of the word tables that hold grammatical features,
+# they store the value of the feature's member instead of its name
+feature_columns: Dict[str, Type[enum.Enum]] = {
+    'noun_case': Case,
+    'plurality': Plurality,
+    'person': Person,
+    'mood': Mood,
+    'tense': Tense,
+    'gender': Gender
+}
+
+
+def feature_code(feature: Type[enum.Enum], name: Union[str, int, None]) -> Union[int, None]:
+    """
+    :param feature: The enum of the feature
+    :param name: The feature the way it's tagged on wiktionary or in the kaikki dump, ie. 'nominative', 'third-person',
+    or 'none' for a form that doesn't have the feature, codes are passed through as they are
+    :return: Returns the value of the matching member, or None if the name isn't one of them
+    """
+    if name is None or isinstance(name, int):
+        return name
+    key = name.strip().upper()
+    if key.endswith('-PERSON'):
+        key = key[:-len('-PERSON')]
+    member = feature.__members__.get(key)
+    return member.value if member is not None else None
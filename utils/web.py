@@ -1,4 +1,6 @@
 import ssl
+import threading
+import time
 
 
 illegal_filename_characters = '#%&${}\\<>*?/ !\'":@+`|='
@@ -13,3 +15,29 @@ def prepare_filename(url: str) -> str:
 
 def use_unverified_ssl():
     ssl._create_default_https_context = ssl._create_unverified_context
+
+
+class RateLimiter:
+    """
+    Spaces out the callers of wait so that no more than rate of them get through each second,
+    it can be shared between threads
+    """
+    def __init__(self, rate: float):
+        """
+        :param rate: The number of calls allowed per second, 0 or less disables the limit
+        """
+        self.interval = 1 / rate if rate > 0 else 0
+        self.lock = threading.Lock()
+        self.next_slot = 0.
+
+    def wait(self):
+        if self.interval == 0:
+            return
+
+        with self.lock:
+            now = time.monotonic()
+            slot = max(now, self.next_slot)
+            self.next_slot = slot + self.interval
+
+        if slot > now:
+            time.sleep(slot - now)